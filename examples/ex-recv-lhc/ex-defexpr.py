@@ -1,6 +1,8 @@
 import time
 from pathlib import Path
 
+import numpy as np
+
 from pymadng import MAD
 
 current_dir = str(Path(__file__).parent) + "/"
@@ -88,10 +90,22 @@ t0 = time.time()
 mad.send("len = #expr py:send(len) for i=1,len do py:send(expr[i]()) end")
 expr_lst2 = [mad.recv(f"expr[{i + 1}]()") for i in range(mad.recv())]
 t1 = time.time()
-print("eval time method 4:", t1 - t0, " sec\n")
+print("eval time method 4:", t1 - t0, " sec")
+
+t0 = time.time()
+expr_vec = mad.eval_many("expr")  # One vector for all the expressions
+t1 = time.time()
+print("eval time method 5:", t1 - t0, " sec\n")
 
 
 print("sanity check", expr_lst1 == expr_lst2, len(expr_lst1))
+print("sanity check", bool(np.allclose(expr_vec, expr_lst1, equal_nan=True)), len(expr_vec))
+
+t0 = time.time()
+names, values = mad.eval_deferred("MADX")  # The names and values of all the MADX expressions
+t1 = time.time()
+print("time to evaluate every deferred expression of MADX", t1 - t0, "sec")
+print(len(names))
 
 t0 = time.time()
 mad["lhcb1"] = mad.MADX.lhcb1
@@ -121,3 +135,10 @@ list_of_names = mad.recv("lhcb2_tbl")
 t1 = time.time()
 print("time to retrieve every element name in lhcb2 sequence", t1 - t0, "sec")
 print(len(list_of_names))
+
+
+t0 = time.time()
+lhcb1 = mad.lhcb1.export(["name", "kind", "l"])  # One transfer for the whole sequence
+t1 = time.time()
+print("time to export the names, kinds, positions and lengths of lhcb1", t1 - t0, "sec")
+print(len(lhcb1["name"]))
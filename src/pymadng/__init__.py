@@ -1,4 +1,7 @@
+from .madp_cache import ResultCache
 from .madp_object import MAD
+from .madp_parallel import parallel_scan
+from .madp_tpsa import TPSA, DAMap
 
 __title__ = "pymadng"
 __version__ = "0.9.6"
@@ -10,4 +13,4 @@ __credits__ = """
 Creator: Joshua Gray <joshua.mark.gray at cern.ch>
 """
 
-__all__ = ["MAD"]
+__all__ = ["MAD", "TPSA", "DAMap", "ResultCache", "parallel_scan"]
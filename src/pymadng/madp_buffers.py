@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class TableBuffer:
+    """Columns of a MAD-NG table received so far, in arrays that grow geometrically.
+
+    Used by `MadObject.sync` so that appending rows is amortised constant time per row.
+    """
+
+    def __init__(self, colnames: list[str] | None = None):
+        self.colnames = colnames
+        self.nrow = 0
+        self._cols: dict[str, np.ndarray] = {}
+
+    def append(self, cols: dict[str, np.ndarray]):
+        """Append rows, given as one array per column (all of the same length)."""
+        nnew = len(next(iter(cols.values()), ()))
+        if nnew == 0:  # Nothing to add, and the type of empty columns is unknown
+            return
+        nrow = self.nrow + nnew
+        for name, val in cols.items():
+            buf = self._cols.get(name)
+            if buf is None or len(buf) < nrow:
+                dtype = object if val.dtype.kind == "U" else val.dtype  # Strings of any length
+                grown = np.empty(max(nrow, 2 * (0 if buf is None else len(buf)), 16), dtype=dtype)
+                if buf is not None:
+                    grown[: self.nrow] = buf[: self.nrow]
+                buf = self._cols[name] = grown
+            buf[self.nrow : nrow] = val
+        self.nrow = nrow
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Return views of the rows received so far, keyed by column name."""
+        return {
+            name: self._cols[name][: self.nrow] if name in self._cols else np.empty(0)
+            for name in self.colnames or []
+        }
+
+
+class TurnBuffer:
+    """The coordinates of the particles over the last turns of a tracking, in a ring buffer.
+
+    Filled by `MAD.track_stream`: ``data[k]`` holds the coordinates of each particle (one row
+    of x, px, y, py, t, pt per particle, NaN once lost) at the turn ``turns[k]`` (-1 if empty),
+    and the oldest turn is overwritten once the buffer is full.
+    """
+
+    def __init__(self, data: int | np.ndarray):
+        """Create an empty buffer.
+
+        Args:
+            data (int | np.ndarray): The number of turns to keep in memory, or an array of shape (turns, particles, 6) to write to (e.g. a ``np.memmap``).
+        """
+        self.data = data if isinstance(data, np.ndarray) else None
+        self.capacity = len(data) if isinstance(data, np.ndarray) else int(data)
+        if self.capacity <= 0:
+            raise ValueError("The buffer must hold at least one turn")
+        self.turns = np.full(self.capacity, -1, dtype=np.int64)
+        self.count = 0  # The number of turns written, including the overwritten ones
+
+    def append(self, turn: int, coords: np.ndarray) -> None:
+        """Write the coordinates of the particles at a turn, overwriting the oldest turn if full."""
+        if self.data is None:
+            self.data = np.empty((self.capacity, *coords.shape))
+        k = self.count % self.capacity
+        self.data[k], self.turns[k] = coords, turn
+        self.count += 1
+
+    def ordered(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the turns held and their coordinates (copied), from the oldest to the newest."""
+        if self.data is None:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0, 6))
+        start = self.count % self.capacity if self.count > self.capacity else 0
+        order = (start + np.arange(min(self.count, self.capacity))) % self.capacity
+        return self.turns[order], self.data[order]
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .madp_dependencies import LUA_RANDOM_GENERATORS
+
+# Lua function to hash the content of MAD-NG values (e.g. a sequence and a beam), evaluating the
+# deferred expressions of the objects as MAD-NG does, so that identical lattice states give
+# identical fingerprints. The other functions (e.g. actions) are hashed by identity instead of
+# being called, and the random generators of MADX return 0 during the walk, so that their state
+# is unchanged and the fingerprint is reproducible
+LUA_FINGERPRINT = (
+    LUA_RANDOM_GENERATORS
+    + """
+local function fingerprint (...)
+  local bit = require("bit")
+  local is_sequence, is_object, is_matrix, is_cmatrix, is_imatrix, is_tpsa, is_ctpsa,
+        is_complex in MAD.typeid
+  local h1, h2, seen = bit.tobit(0x811c9dc5), 5381, {}
+  local function feed (str) -- FNV-1a and djb2, for a 64 bit hash
+    for i = 1, #str do
+      local c = str:byte(i)
+      h1 = bit.bxor(h1, c)
+      h1 = bit.tobit(bit.lshift(h1, 24) + h1 * 403)
+      h2 = bit.tobit(h2 * 33 + c)
+    end
+  end
+  local function before (a, b)
+    if type(a) ~= type(b) then return type(a) < type(b) end
+    return a < b
+  end
+  local walk
+  local function walk_number (val)
+    if is_complex(val) then feed(string.format("%a,%a;", val.re, val.im))
+    else feed(string.format("%a;", val))
+    end
+  end
+  function walk (val)
+    local t = type(val)
+    if t == "number" then
+      feed(string.format("%a;", val))
+    elseif t == "string" then
+      feed(#val .. ":" .. val)
+    elseif t == "function" then -- not evaluated, so identified by the function itself
+      feed(tostring(val) .. ";")
+    elseif is_tpsa(val) or is_ctpsa(val) then
+      local nv, mo, nc = val.d.nv, val.mo, 1
+      for k = 1, mo do nc = nc * (nv + k) / k end
+      feed(string.format("tpsa%d,%d{", nv, mo))
+      for i = 1, nc do walk_number(val:get(i)) end
+      feed("}")
+    elseif is_matrix(val) or is_imatrix(val) then
+      for i = 1, #val do feed(string.format("%a;", val[i])) end
+    elseif is_cmatrix(val) then
+      for i = 1, #val do walk_number(val[i]) end
+    elseif is_complex(val) then
+      walk_number(val)
+    elseif t == "table" then
+      if seen[val] then feed("@;") return end
+      seen[val] = true
+      local keys, vals, object = {}, {}, is_object(val)
+      for key, v in pairs(val) do
+        if type(key) == "number" or type(key) == "string" and key:sub(1, 2) ~= "__"
+           and not (val == MADX and random_generators[key]) then
+          if object then -- The value seen by MAD-NG, evaluating the deferred expressions
+            local ok, res = pcall(function () return val[key] end)
+            v = ok and res or "?"
+          end
+          keys[#keys+1], vals[key] = key, v
+        end
+      end
+      table.sort(keys, before)
+      feed("{")
+      for _, key in ipairs(keys) do
+        walk(key)
+        walk(vals[key])
+      end
+      if is_sequence(val) then -- the positions are not stored in the elements
+        for _, _, s, ds in val:iter() do feed(string.format("%a,%a;", s, ds)) end
+      end
+      feed("}")
+    elseif t == "boolean" or t == "nil" then
+      feed(tostring(val) .. ";")
+    else
+      feed(t .. ";")
+    end
+  end
+
+  local function zero () return 0 end
+  local saved = {}
+  for name in pairs(random_generators) do
+    saved[name] = rawget(MADX, name)
+    rawset(MADX, name, zero)
+  end
+  local n, args = select("#", ...), {...}
+  local ok, err = pcall(function ()
+    for i = 1, n do walk(args[i]) end
+  end)
+  for name in pairs(random_generators) do rawset(MADX, name, saved[name]) end
+  if not ok then error(err, 0) end
+  return bit.tohex(h1) .. bit.tohex(h2)
+end
+"""
+)
+
+
+def result_key(*parts: Any) -> str:
+    """Hash the description of a MAD-NG computation into a cache key.
+
+    Args:
+        *parts: The strings, arrays and other values (hashed by repr) describing the computation.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A least recently used cache of the tables computed by MAD-NG (see `MAD.cached_result`).
+
+    Each result is stored as columns (one-dimensional arrays) and header values, and optionally
+    saved to a directory as ``<key>.npz``, to be shared between processes and sessions.
+    """
+
+    def __init__(self, maxsize: int = 32, directory: str | Path | None = None):
+        """Create an empty cache.
+
+        Args:
+            maxsize (int, optional): The maximum number of results kept in memory.
+            directory (str | Path, optional): A directory to save the results to, and to load them from when not in memory.
+        """
+        self.maxsize = maxsize
+        self.directory = Path(directory) if directory is not None else None
+        self._results: OrderedDict[str, tuple[dict[str, np.ndarray], dict[str, Any]]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: str) -> tuple[dict[str, np.ndarray], dict[str, Any]] | None:
+        """Return the columns and header stored for a key, or None if there is no such result."""
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        path = self.directory and self.directory / f"{key}.npz"
+        if path is None or not path.exists():
+            return None
+        with np.load(path) as data:
+            columns = {str(name): data[f"c{i}"] for i, name in enumerate(data["columns"])}
+            header = {str(name): data[f"h{i}"].item() for i, name in enumerate(data["header"])}
+        return self._store(key, columns, header)
+
+    def put(
+        self, key: str, columns: dict[str, np.ndarray], header: dict[str, Any]
+    ) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """Store the columns and header of a result, returning them as stored (read-only arrays)."""
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            np.savez(
+                self.directory / f"{key}.npz",
+                columns=np.array(list(columns), dtype=str),
+                header=np.array(list(header), dtype=str),
+                **{f"c{i}": col for i, col in enumerate(columns.values())},
+                **{f"h{i}": np.asarray(val) for i, val in enumerate(header.values())},
+            )
+        return self._store(key, columns, header)
+
+    def clear(self) -> None:
+        """Remove the results kept in memory (the saved results are kept)."""
+        self._results.clear()
+
+    def _store(self, key: str, columns: dict[str, np.ndarray], header: dict[str, Any]):
+        for col in columns.values():
+            col.flags.writeable = False  # Shared by every call that hits the cache
+        self._results[key] = (columns, header)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+        return columns, header
@@ -5,18 +5,180 @@ from typing import TYPE_CHECKING, Any  # To make stuff look nicer
 
 import numpy as np
 
+from .madp_buffers import TableBuffer
 from .madp_pymad import BaseMadRef, MadProcess, is_private, type_str
 from .madp_strings import format_args_to_string, format_kwargs_to_string
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator
 
 # TODO: Are you able to store the actual parent? (jgray 2023)
 # TODO: Allow __setitem__ to work with multiple indices (jgray 2023)
-# TODO: Change __iter__ to use the MAD-NG iterator, ipairs and pairs also (jgray 2025)
 
 MADX_methods = ["load", "open_env", "close_env"]
 
+# Number of values requested from MAD-NG per message when iterating over a reference
+ITER_CHUNK_SIZE = 256
+
+# Lua function to convert a row selection (see format_rows) into a list of MAD-NG row indices
+LUA_ROW_INDICES = """
+local function row_indices (tbl, sel)
+  local nrow, idx, rows = #tbl, {}, sel and sel.rows
+  if rows == nil then
+    for i = 1, nrow do idx[i] = i end
+  elseif MAD.typeid.is_table(rows) and rows.step then -- Python slice (0-based, stop excluded)
+    local step = rows.step
+    assert(step ~= 0, "slice step cannot be zero")
+    local lo, hi = step > 0 and 0 or -1, step > 0 and nrow or nrow - 1
+    local function clamp (i, default)
+      if i == nil then return default end
+      if i < 0 then i = i + nrow end
+      return math.min(math.max(i, lo), hi)
+    end
+    local start = clamp(rows.start, step > 0 and lo or hi)
+    local stop  = clamp(rows.stop , step > 0 and hi or lo)
+    for i = start, stop - (step > 0 and 1 or -1), step do idx[#idx+1] = i + 1 end
+  else                                                -- Python indices (0-based)
+    for k = 1, #rows do
+      local i = rows[k]
+      if i < 0 then i = i + nrow end
+      assert(0 <= i and i < nrow, "row index out of range")
+      idx[k] = i + 1
+    end
+  end
+
+  -- Only keep the rows that pass all the filters
+  if sel and (sel.pattern or sel.kind or sel.selected) then
+    local pattern, names = sel.pattern, sel.pattern and tbl:getcol("name")
+    local kinds, kindcol = nil, sel.kind and tbl:getcol("kind")
+    if sel.kind then
+      kinds = {}
+      for _, kind in ipairs(sel.kind) do kinds[kind] = true end
+    end
+    local n = 0
+    for _, i in ipairs(idx) do
+      if (not pattern  or string.find(names[i], pattern))
+      and (not kinds   or kinds[kindcol[i]])
+      and (not sel.selected or tbl:is_selected(i)) then
+        n = n + 1
+        idx[n] = i
+      end
+    end
+    for k = #idx, n + 1, -1 do idx[k] = nil end
+  end
+  return idx
+end
+"""
+
+# Lua function to send strings as their byte offsets and their concatenation (see split_strings)
+LUA_SEND_STRINGS = """
+local function send_strings (py, strs)
+  local n, pos = #strs, 0
+  local offsets = MAD.imatrix(n + 1, 1)
+  for k = 1, n do
+    offsets:set(k, 1, pos)
+    pos = pos + #strs[k]
+  end
+  offsets:set(n + 1, 1, pos)
+  py:send(offsets)
+  py:send(table.concat(strs))
+end
+"""
+
+
+def format_rows(
+    rows: slice | range | Iterable[int] | None = None,
+    pattern: str | None = None,
+    kind: str | Iterable[str] | None = None,
+    selected: bool = False,
+) -> dict | None:
+    """Convert a Python row selection into the value received by ``LUA_ROW_INDICES``.
+
+    The selection is applied by MAD-NG, so only the selected rows are transferred.
+
+    Args:
+        rows (slice | range | Iterable[int], optional): A slice, 0-based indices or a boolean mask. Defaults to all the rows.
+        pattern (str, optional): A Lua pattern that the ``name`` column must match.
+        kind (str | Iterable[str], optional): The element kind(s) that the ``kind`` column must match.
+        selected (bool, optional): If True, only keep the rows selected in the table (see ``select`` in MAD-NG).
+
+    Returns:
+        dict | None: The selection to send to MAD-NG, or None for all the rows.
+    """
+    sel = {}
+    if isinstance(rows, slice | range):
+        # The step is always given, as this is how MAD-NG recognises a slice
+        slc = {"start": rows.start, "stop": rows.stop, "step": rows.step or 1}
+        sel["rows"] = {key: int(val) for key, val in slc.items() if val is not None}
+    elif rows is not None:
+        rows = np.asarray(rows)
+        if rows.dtype == np.bool_:
+            rows = np.flatnonzero(rows)
+        sel["rows"] = rows.astype(np.int32).reshape(-1, 1) if rows.size else []
+    if pattern is not None:
+        sel["pattern"] = pattern
+    if kind is not None:
+        sel["kind"] = [kind] if isinstance(kind, str) else list(kind)
+    if selected:
+        sel["selected"] = True
+    return sel or None
+
+
+# Lua functions to send the keys of MAD-NG tables as one string, for dir and autocompletion
+LUA_PACK_KEYS = """
+local function string_keys (tbl) -- The public string keys of a table
+  local keys = {}
+  for key in pairs(tbl) do
+    if type(key) == "string" and key:sub(1, 1) ~= "_" then keys[#keys+1] = key end
+  end
+  return keys
+end
+local function pack_keys (keys, skip) -- Join a list of keys (except those in skip) with newlines
+  local packed = {}
+  for _, key in ipairs(keys) do
+    if not (skip and skip[key]) then packed[#packed+1] = key end
+  end
+  return table.concat(packed, "\\n")
+end
+"""
+
+
+def unpack_keys(packed: str) -> list[str]:
+    """Split the keys packed by ``pack_keys`` in ``LUA_PACK_KEYS``."""
+    return packed.split("\n") if packed else []
+
+
+def fetch_keys(mad_proc: MadProcess, *names: str) -> list[str]:
+    """Retrieve the public string keys of MAD-NG tables.
+
+    The keys are cached per name in ``mad_proc.dir_cache``, and those not cached are fetched in a
+    single message, so repeated autocompletion does not query MAD-NG.
+
+    Args:
+        mad_proc (MadProcess): The MAD-NG process.
+        *names (str): The names of the tables.
+
+    Returns:
+        list[str]: The keys of all the tables.
+    """
+    cache = mad_proc.dir_cache
+    missing = [name for name in names if name not in cache]
+    if missing:
+        # The keys of a _last object are stored in its metatable
+        exprs = [f"{x}.__metatable or {x}" if x[:5] == "_last" else x for x in missing]
+        mad_proc.protected_send(
+            LUA_PACK_KEYS
+            + "\n".join(f"{mad_proc.py_name}:send(pack_keys(string_keys({x})))" for x in exprs),
+            invalidate=False,  # Only reads the keys, so the other cached keys remain valid
+        )
+        for name in missing:
+            cache[name] = unpack_keys(mad_proc.recv())
+    return [key for name in names for key in cache[name]]
+
+
+# Reductions computed by MAD-NG in MadObject.aggregate (std and var are the population ones, as numpy)
+AGGREGATIONS = ("count", "sum", "mean", "min", "max", "absmax", "rms", "std", "var")
+
 
 # MAD High Level reference
 class MadRef(BaseMadRef):
@@ -126,16 +288,92 @@ class MadRef(BaseMadRef):
             f"Type: {type(self).__name__})>"
         )
 
+    def __iter__(self) -> Iterator[Any]:
+        return self.ipairs()
+
+    def ipairs(self, chunk_size: int = ITER_CHUNK_SIZE) -> Iterator[Any]:
+        """Iterate over the array part of the reference, like ``ipairs`` in MAD-NG.
+
+        The values are requested from MAD-NG ``chunk_size`` at a time and buffered in Python,
+        so the pipe is free for other communication within the body of the loop.
+
+        Args:
+            chunk_size (int, optional): The number of values to retrieve per message.
+
+        Yields:
+            The values of the reference, in order, until the first nil.
+        """
+        assert chunk_size > 0, "The chunk size must be a positive integer"
+        py_name, name = self._mad.py_name, self._name
+        start = 1
+        while True:
+            stop = start + chunk_size - 1
+            self._mad.protected_send(f"""
+local obj = {name}
+for i = {start}, {stop} do
+  local val = obj[i]
+  if val == nil then break end
+  {py_name}:send(val)
+end
+{py_name}:send(nil)
+""")
+            chunk = []
+            for i in range(start, stop + 1):
+                val = self._mad.recv(f"{name}[{i}]")
+                if val is None:
+                    break
+                chunk.append(val)
+            else:
+                self._mad.recv()  # The end of the chunk (nil)
+
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            start = stop + 1
+
+    def pairs(self, chunk_size: int = ITER_CHUNK_SIZE) -> Iterator[tuple[Any, Any]]:
+        """Iterate over the keys and values of the reference, like ``pairs`` in MAD-NG.
+
+        The iterator state is kept in MAD-NG, so the (key, value) pairs are requested
+        ``chunk_size`` at a time, in the order MAD-NG gives them.
+
+        Args:
+            chunk_size (int, optional): The number of pairs to retrieve per message.
+
+        Yields:
+            tuple: The key and value of each entry of the reference.
+        """
+        assert chunk_size > 0, "The chunk size must be a positive integer"
+        py_name, name = self._mad.py_name, self._name
+        state = MadLastRef(self._mad)  # Released when the generator is
+        self._mad.protected_send(
+            f"do local f, s, k = pairs({name}); {state._name} = {{f=f, s=s, k=k}} end"
+        )
+        while True:
+            self._mad.protected_send(f"""
+local st = {state._name}
+for _ = 1, {chunk_size} do
+  local key, val = st.f(st.s, st.k)
+  st.k = key
+  if key == nil then break end
+  {py_name}:send(key)
+  {py_name}:send(val)
+end
+{py_name}:send(nil)
+""")
+            chunk = []
+            while (key := self._mad.recv()) is not None:
+                if isinstance(key, np.int32):
+                    key = int(key)
+                key_str = f"'{key}'" if isinstance(key, str) else key
+                chunk.append((key, self._mad.recv(f"{name}[{key_str}]")))
+
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+
     def __dir__(self) -> Iterable[str]:
-        name = self._name
-        if name[:5] == "_last":
-            name = name + ".__metatable or " + name
-        self._mad.protected_send(f"""
-    local modList={{}}; local i = 1;
-    for modname, mod in pairs({name}) do modList[i] = modname; i = i + 1; end
-    {self._mad.py_name}:send(modList, true)
-    """)
-        return [x for x in self._mad.recv() if isinstance(x, str) and x[0] != "_"]
+        return fetch_keys(self._mad, self._name)
 
     def __deepcopy__(self, memo):
         val = self.eval()
@@ -159,17 +397,26 @@ class MadObject(MadRef):
     """
 
     def __dir__(self) -> Iterable[str]:
-        if not self._mad.ipython_use_jedi:
+        keys = self._mad.dir_cache.get(self._name)
+        if keys is None:
+            # Retrieve the variables, then the methods (not used by jedi) in a single message
+            py_name, jedi = self._mad.py_name, self._mad.ipython_use_jedi
             self._mad.protected_send(
-                f"{self._mad.py_name}:send({self._name}:get_varkeys(MAD.object), true)"
+                f"""{LUA_PACK_KEYS}
+    local varkeys, isvar = {self._name}:get_varkeys(MAD.object, false), {{}}
+    for _, key in ipairs(varkeys) do isvar[key] = true end
+    {py_name}:send(pack_keys(varkeys))
+    if {str(not jedi).lower()} then
+      {py_name}:send(pack_keys({self._name}:get_varkeys(MAD.object), isvar))
+    end
+    """,
+                invalidate=False,
             )
-        varnames = self._mad.protected_variable_retrieval(
-            f"{self._name}:get_varkeys(MAD.object, false)", shallow_copy=True
-        )
-
-        if not self._mad.ipython_use_jedi:
-            varnames.extend([x + "()" for x in self._mad.recv() if x not in varnames])
-        return varnames
+            keys = unpack_keys(self._mad.recv())
+            if not jedi:
+                keys.extend([x + "()" for x in unpack_keys(self._mad.recv())])
+            self._mad.dir_cache[self._name] = keys
+        return list(keys)
 
     def __call__(self, *args, **kwargs):
         last_obj = MadLastObject(self._mad)
@@ -183,29 +430,430 @@ class MadObject(MadRef):
             self._mad.send(var)
         return last_obj
 
-    def __iter__(self):
-        self._iterindex = -1
-        return self
+    def _fetch_columnar(
+        self, columns: list[str] | None, sel: dict | None, row_major: bool = False
+    ) -> tuple[list[str], int, list[str], np.ndarray, dict[str, tuple[np.ndarray, str]]]:
+        """Retrieve the numeric columns as one matrix and the string columns as offsets and data.
 
-    def __next__(self):
-        try:
-            self._iterindex += 1
-            return self[self._iterindex]
-        except IndexError:
-            raise StopIteration
+        Returns:
+            tuple: The column names, the number of rows, the numeric column names, the matrix of
+            numeric columns (one row per column, unless row_major) and the string columns as
+            (offsets, data), where the offsets (in bytes) have one more entry than there are rows.
+        """
+        py_name, obj_name = self._mad.py_name, self._name
+        numshape = "nrow, #numcols" if row_major else "#numcols, nrow"
+        numset = "mat:set(k, j, col[i])" if row_major else "mat:set(j, k, col[i])"
+        self._mad.protected_send(
+            LUA_ROW_INDICES
+            + LUA_SEND_STRINGS
+            + f"""
+local is_number, is_string, is_vector, is_mtable in MAD.typeid
+local sel, colnames = {py_name}:recv(), {py_name}:recv() -- Empty the pipe before anything can fail
+local tbl = {obj_name}
+assert(is_mtable(tbl), "object is not a table, cannot fetch columns")
+local idx = row_indices(tbl, sel)
+colnames = colnames or tbl:colnames()
+local nrow, numnames, numcols, strnames, strcols = #idx, {{}}, {{}}, {{}}, {{}}
+
+-- Sort the columns into numeric and string columns, before anything is sent
+for _, name in ipairs(colnames) do
+  local col = tbl:getcol(name)
+  local is_num, is_str = is_vector(col) and not getmetatable(col), not is_vector(col)
+  if not is_num then
+    is_num = true
+    for _, i in ipairs(idx) do
+      is_num = is_num and is_number(col[i])
+      is_str = is_str and is_string(col[i])
+    end
+  end
+  if is_num then
+    numnames[#numnames+1], numcols[#numcols+1] = name, col
+  elseif is_str then
+    strnames[#strnames+1], strcols[#strcols+1] = name, col
+  else
+    error("column '" .. name .. "' is neither numeric nor string")
+  end
+end
+
+-- All the numeric columns are sent as a single matrix
+local mat = nrow > 0 and #numcols > 0 and MAD.matrix({numshape}) or nil
+for j, col in ipairs(numcols) do
+  for k, i in ipairs(idx) do {numset} end
+end
+
+{py_name}:send(colnames, true)
+{py_name}:send(numnames, true)
+{py_name}:send(strnames, true)
+{py_name}:send(nrow)
+{py_name}:send(mat)
+
+-- The string columns are sent as the byte offsets of each string and the concatenated strings
+for _, col in ipairs(strcols) do
+  local strs = table.new(nrow, 0)
+  for k, i in ipairs(idx) do strs[k] = col[i] end
+  send_strings({py_name}, strs)
+end
+"""
+        )
+        self._mad.send(sel).send(columns)
+        colnames, numnames, strnames = self._mad.recv(), self._mad.recv(), self._mad.recv()
+        nrow, mat = int(self._mad.recv()), self._mad.recv()
+        if mat is None:
+            mat = np.empty((nrow, len(numnames)) if row_major else (len(numnames), nrow))
+        strcols = {name: (self._mad.recv().ravel(), self._mad.recv()) for name in strnames}
+        return colnames, nrow, numnames, mat, strcols
+
+    def fetch_columns(
+        self,
+        columns: list[str] | None = None,
+        rows: slice | range | Iterable[int] | None = None,
+        pattern: str | None = None,
+        kind: str | Iterable[str] | None = None,
+        selected: bool = False,
+    ) -> dict[str, np.ndarray]:
+        """Retrieve columns of a MAD-NG table as one-dimensional arrays, in a single transfer.
+
+        The numeric columns are stacked into one matrix by MAD-NG, while string columns are
+        sent as one string each.
+
+        Args:
+            columns (list, optional): The columns to retrieve. Defaults to all the columns.
+            rows (slice | range | Iterable[int], optional): The rows to retrieve, given as a slice, 0-based indices or a boolean mask. Defaults to all the rows.
+            pattern (str, optional): Only retrieve the rows whose name matches this Lua pattern.
+            kind (str | Iterable[str], optional): Only retrieve the rows of these element kinds.
+            selected (bool, optional): If True, only retrieve the rows selected in the table.
+
+        Returns:
+            dict[str, np.ndarray]: The requested columns, keyed by name.
+        """
+        colnames, _, numnames, mat, strcols = self._fetch_columnar(
+            columns, format_rows(rows, pattern, kind, selected)
+        )
+        fetched = dict(zip(numnames, mat))
+        for name, (offsets, data) in strcols.items():
+            fetched[name] = np.array(split_strings(offsets, data), dtype=str)
+        return {name: fetched[name] for name in colnames}
+
+    def export(
+        self, attrs: list[str] | None = None, at: str | None = "s", refer: str = "entry"
+    ) -> dict[str, np.ndarray]:
+        """Retrieve attributes of all the elements of a MAD-NG sequence, in a single transfer.
+
+        The attributes that are strings for any element are sent as one string each (empty
+        where absent), and the others as one matrix of numbers (NaN where absent).
+
+        Args:
+            attrs (list[str], optional): The element attributes to retrieve. Defaults to ``["name", "kind", "l"]``.
+            at (str, optional): The key of the element positions in the result, or None to skip them.
+            refer (str, optional): The position of the elements to retrieve, ``"entry"``, ``"centre"`` or ``"exit"``.
+
+        Returns:
+            dict[str, np.ndarray]: The positions and attributes of the elements, keyed by name.
+        """
+        attrs = ["name", "kind", "l"] if attrs is None else list(attrs)
+        offset = {"entry": 0, "centre": 0.5, "exit": 1}.get(refer)
+        if offset is None:
+            raise ValueError(f"refer must be 'entry', 'centre' or 'exit', not {refer!r}")
+        py_name = self._mad.py_name
+        self._mad.protected_send(
+            LUA_SEND_STRINGS
+            + f"""
+local is_number, is_string, is_sequence in MAD.typeid
+local seq, attrs = {self._name}, {py_name}:recv()
+assert(is_sequence(seq), "object is not a sequence, cannot export")
+local n, spos, cols = #seq, table.new(#seq, 0), {{}}
+for j = 1, #attrs do cols[j] = table.new(n, 0) end
+for i, elm, s, ds in seq:iter() do
+  spos[i] = s + {offset} * ds
+  for j, attr in ipairs(attrs) do cols[j][i] = elm[attr] end
+end
+
+-- Sort the attributes into strings and numbers, before anything is sent
+local numnames, numcols, strnames, strcols = {{}}, {{}}, {{}}, {{}}
+if {str(at is not None).lower()} then numcols[1] = spos end
+for j, attr in ipairs(attrs) do
+  local is_str = false
+  for i = 1, n do is_str = is_str or is_string(cols[j][i]) end
+  if is_str then
+    for i = 1, n do cols[j][i] = is_string(cols[j][i]) and cols[j][i] or "" end
+    strnames[#strnames+1], strcols[#strcols+1] = attr, cols[j]
+  else
+    numnames[#numnames+1], numcols[#numcols+1] = attr, cols[j]
+  end
+end
+
+-- All the numbers are sent as a single matrix, with one row per attribute
+local mat = n > 0 and #numcols > 0 and MAD.matrix(#numcols, n) or nil
+for j, col in ipairs(numcols) do
+  for i = 1, n do mat:set(j, i, is_number(col[i]) and col[i] or 0/0) end
+end
+{py_name}:send(numnames, true)
+{py_name}:send(strnames, true)
+{py_name}:send(n)
+{py_name}:send(mat)
+for _, col in ipairs(strcols) do send_strings({py_name}, col) end
+"""
+        ).send(attrs)
+        numnames, strnames = self._mad.recv() or [], self._mad.recv() or []
+        nelm, mat = int(self._mad.recv()), self._mad.recv()
+        if at is not None:
+            numnames.insert(0, at)
+        if mat is None:
+            mat = np.empty((len(numnames), nelm))
+        exported = dict(zip(numnames, mat))
+        for name in strnames:
+            offsets, data = self._mad.recv().ravel(), self._mad.recv()
+            exported[name] = np.array(split_strings(offsets, data), dtype=str)
+        return {name: exported[name] for name in [at, *attrs] if name in exported}
+
+    def update(
+        self,
+        elements: str | int | Iterable[str] | Iterable[int],
+        values: dict[str, float | Iterable[float]],
+        keep_deferred: bool = False,
+    ) -> None:
+        """Set attributes of elements of a MAD-NG sequence from arrays, in a single transfer.
+
+        The elements and values are sent once and applied by a loop in MAD-NG.
+
+        Args:
+            elements (str | int | Iterable[str] | Iterable[int]): The names of the elements (all the elements of a name are updated) or their 0-based indices.
+            values (dict[str, float | Iterable[float]]): The value(s) of each attribute, one per element (or one for all).
+            keep_deferred (bool, optional): If True, the attributes defined by deferred expressions are not overwritten.
+        """
+        elements = [elements] if isinstance(elements, str | int) else list(elements)
+        if all(isinstance(elm, str) for elm in elements):
+            targets = "\n".join(elements)  # Names are sent in one string
+        else:
+            targets = np.asarray(elements, dtype=np.int32).reshape(-1, 1)
+        attrs, nelm = list(values), len(elements)
+        if not attrs or not nelm:
+            return
+        mat = np.column_stack(
+            [np.broadcast_to(np.asarray(val, dtype=np.float64), (nelm,)) for val in values.values()]
+        )
+        py_name = self._mad.py_name
+        self._mad.protected_send(f"""
+local is_string, is_sequence in MAD.typeid
+local seq, attrs = {self._name}, {py_name}:recv()
+local targets, vals = {py_name}:recv(), {py_name}:recv()
+assert(is_sequence(seq), "object is not a sequence, cannot update")
+local elms = {{}} -- the list of elements to update for each target
+if is_string(targets) then
+  local byname = {{}}
+  for _, elm in seq:iter() do
+    byname[elm.name] = byname[elm.name] or {{}}
+    table.insert(byname[elm.name], elm)
+  end
+  for name in targets:gmatch("[^\\n]+") do
+    elms[#elms+1] = byname[name] or error("no element named '" .. name .. "' in the sequence")
+  end
+else
+  for k = 1, #targets do
+    local i = targets[k] < 0 and targets[k] + #seq or targets[k]
+    assert(0 <= i and i < #seq, "element index out of range")
+    elms[k] = {{seq[i + 1]}}
+  end
+end
+for k, lst in ipairs(elms) do
+  for _, elm in ipairs(lst) do
+    for j, attr in ipairs(attrs) do
+      if not ({str(keep_deferred).lower()} and type(elm:var_get(attr)) == "function") then
+        elm[attr] = vals:get(k, j)
+      end
+    end
+  end
+end
+""")
+        self._mad.send(attrs).send(targets).send(mat)
+
+    def convert_to_structured_array(
+        self,
+        columns: list[str] | None = None,
+        rows: slice | range | Iterable[int] | None = None,
+        pattern: str | None = None,
+        kind: str | Iterable[str] | None = None,
+        selected: bool = False,
+    ) -> np.ndarray:
+        """Converts the table to a numpy structured array, with one field per column.
+
+        Only numeric and string columns are supported. If all the columns are numeric, the
+        array is a view of the matrix received from MAD-NG, without any copy.
+
+        Args:
+            columns (list, optional): The columns to include in the array. Defaults to all the columns.
+            rows, pattern, kind, selected (optional): The rows to include, see `fetch_columns`.
+
+        Returns:
+            np.ndarray: The structured array containing the table data.
+        """
+        colnames, nrow, numnames, mat, strcols = self._fetch_columnar(
+            columns, format_rows(rows, pattern, kind, selected), row_major=True
+        )
+        if numnames and not strcols:  # The matrix is already laid out as the records
+            dtype = np.dtype([(name, np.float64) for name in numnames])
+            return np.ascontiguousarray(mat).view(dtype).reshape(nrow)
+
+        strs = {name: split_strings(*col) for name, col in strcols.items()}
+        dtype = [
+            (name, np.float64)
+            if name in numnames
+            else (name, str, max(map(len, strs[name]), default=0) or 1)
+            for name in colnames
+        ]
+        arr = np.empty(nrow, dtype=dtype)
+        for j, name in enumerate(numnames):
+            arr[name] = mat[:, j]
+        for name, val in strs.items():
+            arr[name] = val
+        return arr
+
+    def convert_to_record_batch(
+        self,
+        columns: list[str] | None = None,
+        rows: slice | range | Iterable[int] | None = None,
+        pattern: str | None = None,
+        kind: str | Iterable[str] | None = None,
+        selected: bool = False,
+    ):
+        """Converts the table to a pyarrow RecordBatch, with one array per column.
+
+        Only numeric and string columns are supported. The arrays use the buffers received from
+        MAD-NG directly, so the batch can be turned into pandas or polars frames with at most one copy.
+
+        Args:
+            columns (list, optional): The columns to include in the batch. Defaults to all the columns.
+            rows, pattern, kind, selected (optional): The rows to include, see `fetch_columns`.
+
+        Returns:
+            pyarrow.RecordBatch: The record batch containing the table data.
+        """
+        import pyarrow as pa
+
+        colnames, nrow, numnames, mat, strcols = self._fetch_columnar(
+            columns, format_rows(rows, pattern, kind, selected)
+        )
+        arrays = dict(zip(numnames, map(pa.array, mat)))
+        for name, (offsets, data) in strcols.items():
+            arrays[name] = pa.StringArray.from_buffers(
+                nrow, pa.py_buffer(offsets), pa.py_buffer(data.encode("utf-8"))
+            )
+        return pa.RecordBatch.from_arrays([arrays[name] for name in colnames], names=colnames)
+
+    def sync(self, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+        """Retrieve the rows added to a MAD-NG table since the last call, for growing tables.
+
+        The rows already received are kept by name in ``sync_buffers`` of the process, so only new
+        rows are transferred, even through a new reference (e.g. ``mad.tbl``), and they are
+        appended to arrays that grow geometrically. The table must only be appended to (e.g. by
+        ``save`` in track or twiss).
+
+        Args:
+            columns (list, optional): The columns to retrieve. Defaults to all the columns, and changing them restarts from the first row.
+
+        Returns:
+            dict[str, np.ndarray]: All the rows received so far, keyed by column name.
+        """
+        buffer = self._mad.sync_buffers.get(self._name)
+        if buffer is None or (columns is not None and list(columns) != buffer.colnames):
+            buffer = self._mad.sync_buffers[self._name] = TableBuffer(columns and list(columns))
+
+        colnames, _, numnames, mat, strcols = self._fetch_columnar(
+            buffer.colnames, format_rows(slice(buffer.nrow, None))
+        )
+        new_rows = dict(zip(numnames, mat))
+        for name, (offsets, data) in strcols.items():
+            new_rows[name] = np.array(split_strings(offsets, data), dtype=object)
+        buffer.colnames = colnames
+        buffer.append(new_rows)
+        return buffer.columns()
+
+    def aggregate(
+        self, aggregations: dict[str, str | list[str]], where: dict | None = None
+    ) -> dict[str, dict[str, float]]:
+        """Compute reductions of the columns of a MAD-NG table, within MAD-NG.
+
+        Only the resulting scalars are transferred, instead of the columns. The available
+        reductions are count, sum, mean, min, max, absmax, rms, std and var (std and var are
+        the population ones, like numpy). Reductions over no rows are NaN, except count and sum.
+
+        Args:
+            aggregations (dict): The reduction(s) to compute for each column, e.g. ``{"beta11": ["max", "rms"]}``.
+            where (dict, optional): The rows to reduce over, given as the keyword arguments of `fetch_columns` (rows, pattern, kind, selected). Defaults to all the rows.
+
+        Returns:
+            dict[str, dict[str, float]]: The value of each reduction, keyed by column then reduction.
+
+        Raises:
+            ValueError: If a reduction is not known.
+        """
+        aggs = {
+            col: [red] if isinstance(red, str) else list(red) for col, red in aggregations.items()
+        }
+        unknown = {red for reds in aggs.values() for red in reds}.difference(AGGREGATIONS)
+        if unknown:
+            raise ValueError(
+                f"Unknown aggregations {sorted(unknown)}, expected any of {AGGREGATIONS}"
+            )
+        if not any(aggs.values()):
+            return {col: {} for col in aggs}
+
+        py_name, obj_name = self._mad.py_name, self._name
+        self._mad.protected_send(
+            LUA_ROW_INDICES
+            + f"""
+local sqrt, abs, max, min, huge in math
+local sel, aggs = {py_name}:recv(), {py_name}:recv() -- Empty the pipe before anything can fail
+local tbl = {obj_name}
+assert(MAD.typeid.is_mtable(tbl), "object is not a table, cannot aggregate")
+local idx = row_indices(tbl, sel)
+local res, cnt, nan = {{}}, #idx, 0/0
+for _, agg in ipairs(aggs) do
+  local col, sum, sum2, lo, hi = tbl:getcol(agg[1]), 0, 0, huge, -huge
+  for _, i in ipairs(idx) do
+    local val = col[i]
+    sum, sum2, lo, hi = sum + val, sum2 + val*val, min(lo, val), max(hi, val)
+  end
+  local mean, var = sum / cnt, 0
+  for _, i in ipairs(idx) do var = var + (col[i] - mean)^2 end -- Second pass is more accurate
+  var = var / cnt
+  local stats = {{
+    count = cnt, sum = sum, mean = mean, rms = sqrt(sum2 / cnt), var = var, std = sqrt(var),
+    min = cnt > 0 and lo or nan, max = cnt > 0 and hi or nan,
+    absmax = cnt > 0 and max(abs(lo), abs(hi)) or nan,
+  }}
+  for _, red in ipairs(agg[2]) do res[#res+1] = stats[red] end
+end
+{py_name}:send(MAD.vector(res))
+"""
+        )
+        self._mad.send(format_rows(**(where or {}))).send(
+            [[col, reds] for col, reds in aggs.items()]
+        )
+        values = iter(self._mad.recv().ravel().tolist())
+        return {col: {red: next(values) for red in reds} for col, reds in aggs.items()}
 
     def to_df(
-        self, columns: list | None = None, force_pandas: bool = False
+        self, columns: list | None = None, force_pandas: bool = False, **selection
     ):  # For backwards compatibility (jgray 2024)
         """See `convert_to_dataframe`"""
-        return self.convert_to_dataframe(columns, force_pandas)
+        return self.convert_to_dataframe(columns, force_pandas, **selection)
 
-    def convert_to_dataframe(self, columns: list | None = None, force_pandas: bool = False):
+    def convert_to_dataframe(
+        self,
+        columns: list | None = None,
+        force_pandas: bool = False,
+        rows: slice | range | Iterable[int] | None = None,
+        pattern: str | None = None,
+        kind: str | Iterable[str] | None = None,
+        selected: bool = False,
+    ):
         """Converts the object to a pandas dataframe.
 
         Args:
             columns (list, optional): List of columns to include in the dataframe. Defaults to None.
             force_pandas (bool, optional): If True, always use pandas.DataFrame. Defaults to False.
+            rows, pattern, kind, selected (optional): The rows to include, see `fetch_columns`.
 
         Returns:
             pandas.DataFrame or tfs.TfsDataFrame: The dataframe containing the object's data.
@@ -229,25 +877,31 @@ class MadObject(MadRef):
 
         py_name, obj_name = self._mad.py_name, self._name
         self._mad.protected_send(  # Sending every value individually is slow (sending vectors is fast)
-            f"""
-local is_vector, is_number, is_string in MAD.typeid
+            LUA_ROW_INDICES
+            + f"""
+local is_vector, is_number, is_string, is_boolean, is_complex in MAD.typeid
+local sel = {py_name}:recv()                                -- Get the row selection
 local colnames = {py_name}:recv() or {obj_name}:colnames() -- Get the column names
+local idx = row_indices({obj_name}, sel)
 {py_name}:send(colnames, true)               -- Send the column names
+{py_name}:send(sel and idx, true)            -- Send the selected rows (to name references)
 
 -- Loop through all the column names and send them with their data
 for i, colname in ipairs(colnames) do
   local col = {obj_name}:getcol(colname)
 
   -- If the column is not a vector and has a metatable, then convert it to a table (reference or generator columns)
-  if not is_vector(col) or getmetatable(col) then
-    local tbl = table.new(#col, 0)
-    local conv_to_vec = true
-    local conv_to_str = true
-    for i, val in ipairs(col) do
+  -- If only some of the rows are selected, then the column is always converted
+  if sel or not is_vector(col) or getmetatable(col) then
+    local tbl = table.new(#idx, 0)
+    local conv_to_vec = #idx > 0
+    local conv_to_str = #idx > 0
+    for k, i in ipairs(idx) do
+      local val = col[i]
     -- From testing, checking if I can convert to a vector is faster than sending the table
       conv_to_vec = conv_to_vec and is_number(val)
       conv_to_str = conv_to_str and is_string(val)
-      tbl[i] = val
+      tbl[k] = val
     end
     if conv_to_str then
       tbl = table.concat(tbl, "\\n")
@@ -260,31 +914,50 @@ for i, colname in ipairs(colnames) do
   {py_name}:send(col, true) -- Send the column data
 end
 
-local header = {obj_name}.header -- Get the header names
-{py_name}:send(header, true)           -- Send the header names
-
+-- Send the scalar header values in one dictionary, and the others one by one
+local header, hdr_scalars, hdr_others = {obj_name}.header, {{}}, {{}}
 for i, attr in ipairs(header) do
-  {py_name}:send({obj_name}[attr], true) -- Send the header data
+  local val = {obj_name}[attr]
+  if is_number(val) or is_string(val) or is_boolean(val) or is_complex(val) then
+    hdr_scalars[attr] = val
+  else
+    hdr_others[#hdr_others+1] = attr
+  end
+end
+{py_name}:send(header, true)      -- Send the header names
+{py_name}:send(hdr_scalars, true) -- Send the scalar header data
+{py_name}:send(hdr_others, true)  -- Send the names of the other header data
+for i, attr in ipairs(hdr_others) do
+  {py_name}:send({obj_name}[attr], true) -- Send the other header data
 end
 """
         )
-        self._mad.send(columns)
+        self._mad.send(format_rows(rows, pattern, kind, selected)).send(columns)
         # Create the dataframe from the data sent
-        colnames = self._mad.recv()
+        colnames, idx = self._mad.recv(), self._mad.recv()
         full_tbl = {  # The string is in case references are within the table
             col: self._mad.recv(f"{obj_name}:getcol('{col}')") for col in colnames
         }
 
         # Get the header names and data
-        hdr_names = self._mad.recv()
-        hdr = {hdr_name: self._mad.recv(f"{obj_name}['{hdr_name}']") for hdr_name in hdr_names}
+        hdr_names, hdr = self._mad.recv(), dict(self._mad.recv() or {})
+        for hdr_name in self._mad.recv():
+            hdr[hdr_name] = self._mad.recv(f"{obj_name}['{hdr_name}']")
+        hdr = {hdr_name: hdr.get(hdr_name) for hdr_name in hdr_names}
 
-        # Not keen on the .squeeze() but it works (ng always sends 2D arrays, but I need the columns in 1D)
+        # Ng always sends 2D arrays, but I need the columns in 1D (ravel also keeps single rows 1D)
         for key, val in full_tbl.items():
             if isinstance(val, np.ndarray):
-                full_tbl[key] = val.squeeze()
+                full_tbl[key] = val.ravel()
             elif isinstance(val, str):
                 full_tbl[key] = val.split("\n")
+            elif idx is not None:  # References must point to the original row, not the selected one
+                full_tbl[key] = [
+                    type(v)(f"{obj_name}:getcol('{key}')[{i}]", self._mad)
+                    if isinstance(v, BaseMadRef)
+                    else v
+                    for v, i in zip(val, idx)
+                ]
 
         # Now create the dataframe
         df = dataframe(full_tbl)
@@ -293,6 +966,40 @@ end
         return df
 
 
+def split_strings(offsets: np.ndarray, data: str) -> list[str]:
+    """Split the concatenated strings sent by MAD-NG using their byte offsets.
+
+    Args:
+        offsets (np.ndarray): The byte offset of each string, followed by the total length.
+        data (str): The concatenated strings.
+
+    Returns:
+        list[str]: The individual strings.
+    """
+    bounds = zip(offsets[:-1].tolist(), offsets[1:].tolist())
+    if len(data) == offsets[-1]:  # Only ASCII, so bytes and characters are the same
+        return [data[start:stop] for start, stop in bounds]
+    raw = data.encode("utf-8")
+    return [raw[start:stop].decode("utf-8") for start, stop in bounds]
+
+
+def join_strings(strs: Iterable[str]) -> tuple[np.ndarray, str]:
+    """Concatenate strings to send to MAD-NG with their byte offsets (the inverse of split_strings).
+
+    Args:
+        strs (Iterable[str]): The strings to concatenate.
+
+    Returns:
+        tuple[np.ndarray, str]: The byte offset of each string followed by the total length (as
+        an int32 column), and the concatenated strings.
+    """
+    strs = [str(x) for x in strs]
+    lengths = [len(x.encode("utf-8")) for x in strs]
+    offsets = np.zeros((len(strs) + 1, 1), dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:, 0])
+    return offsets, "".join(strs)
+
+
 class MadFunc(MadRef):
     """
     A high-level MAD function reference.
@@ -350,6 +1057,10 @@ class MadLast:  # The init and del for a _last object
         self._lastnum = mad_proc.last_counter.get()
         self._name = f"_last[{self._lastnum}]"
         self._parent = "_last"
+        mad_proc.dir_cache.pop(self._name, None)  # The slot may have held another object
+        mad_proc.sync_buffers.pop(self._name, None)
+        for key in [x for x in mad_proc.value_cache or () if x.startswith(self._name)]:
+            del mad_proc.value_cache[key]
 
     def __del__(self):
         self._last_counter.set(self._lastnum)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import numpy as np
+
+# Lua set of the names of the random generators, which are functions of MADX but not deferred
+# expressions: calling them would change the state of the generator
+LUA_RANDOM_GENERATORS = """
+local random_generators = {}
+for _, name in ipairs {"ranf", "gauss", "tgauss", "rand", "randn", "randtn", "randp"} do
+  random_generators[name] = true
+end
+"""
+
+# Lua function to send the dependencies of the deferred expressions of MADX (its Lua closures,
+# not the builtin functions) on its knobs (the variables holding numbers), found by tracing the
+# variables read by each expression. Tracing runs the expressions, so only the variables read by
+# the branches taken with the current values are found, and the random generators are replaced
+# by constants to leave their state unchanged
+LUA_MADX_DEPENDENCIES = (
+    LUA_RANDOM_GENERATORS
+    + """
+local function send_madx_dependencies (py)
+  local is_sequence in MAD.typeid
+  local function zero () return 0 end
+  local function is_expr (val) -- Lua closures, not the builtin functions (e.g. math.sqrt)
+    return type(val) == "function" and debug.getinfo(val, "S").what == "Lua"
+  end
+  local function lookup (tbl, k) return random_generators[k] and zero or tbl[k] end
+  local function trace (fn) -- The names read by a function from its environment (or from MADX)
+    local env, names = getfenv(fn), {}
+    if type(env) ~= "table" then return names end
+    local madx = setmetatable({}, {__index = function (_, k)
+      names[k] = true
+      return lookup(MADX, k)
+    end})
+    setfenv(fn, setmetatable({}, {__index = function (_, k)
+      names[k] = true
+      return env[k] == MADX and madx or lookup(env, k)
+    end}))
+    pcall(fn)
+    setfenv(fn, env)
+    return names
+  end
+
+  local knobnames, knobid, exprnames, elmnames, exprelm, reads, madxreads = {}, {}, {}, {}, {}, {}, {}
+  local function add (name, elm, fn)
+    local e = #exprnames + 1
+    exprnames[e], exprelm[e], reads[e] = name, elm, trace(fn)
+    return reads[e]
+  end
+  for key, val in pairs(MADX) do
+    if type(key) == "string" and type(val) == "number" then
+      knobid[key] = #knobnames -- 0-based
+      knobnames[#knobnames+1] = key
+    end
+  end
+  for key, val in pairs(MADX) do
+    if type(key) ~= "string" or key:sub(1, 2) == "__" or random_generators[key] then -- skip
+    elseif is_expr(val) then
+      madxreads[key] = add(key, -1, val)
+    elseif type(val) == "table" and val ~= MADX and not is_sequence(val) then
+      local elm
+      for attr, fn in pairs(val) do
+        if type(attr) == "string" and attr:sub(1, 2) ~= "__" and is_expr(fn) then
+          if not elm then
+            elm = #elmnames -- 0-based
+            elmnames[#elmnames+1] = key
+          end
+          add(key .. "." .. attr, elm, fn)
+        end
+      end
+    end
+  end
+
+  -- The knobs of an expression, through the expressions of MADX that it reads
+  local memo = {}
+  local function knobs_of (names)
+    local knobs = {}
+    for name in pairs(names) do
+      if knobid[name] then knobs[name] = true
+      elseif madxreads[name] then
+        if not memo[name] then
+          memo[name] = {} -- break cycles
+          memo[name] = knobs_of(madxreads[name])
+        end
+        for knob in pairs(memo[name]) do knobs[knob] = true end
+      end
+    end
+    return knobs
+  end
+  local pairs_ = {}
+  for e = 1, #exprnames do
+    for knob in pairs(knobs_of(reads[e])) do pairs_[#pairs_+1] = {knobid[knob], e - 1} end
+  end
+
+  py:send(table.concat(knobnames, "\\n"))
+  py:send(table.concat(exprnames, "\\n"))
+  py:send(table.concat(elmnames, "\\n"))
+  local knob_expr = #pairs_ > 0 and MAD.imatrix(#pairs_, 2) or nil
+  for k, pair in ipairs(pairs_) do knob_expr:set(k, 1, pair[1]) knob_expr:set(k, 2, pair[2]) end
+  local expr_elm = #exprelm > 0 and MAD.imatrix(#exprelm, 1) or nil
+  for e, elm in ipairs(exprelm) do expr_elm:set(e, 1, elm) end
+  py:send(knob_expr)
+  py:send(expr_elm)
+end
+"""
+)
+
+
+class DependencyIndex:
+    """Dependencies of the deferred expressions of the MAD-X environment on its knobs.
+
+    Built by `MAD.madx_dependencies`, as sparse index arrays: ``expressions[j]`` depends on
+    ``knobs[i]`` for each row ``(i, j)`` of ``knob_expr``, and is an attribute of the element
+    ``elements[expr_element[j]]`` (-1 for the expressions of the environment itself).
+    """
+
+    def __init__(
+        self,
+        knobs: list[str],
+        expressions: list[str],
+        elements: list[str],
+        knob_expr: np.ndarray,
+        expr_element: np.ndarray,
+    ):
+        self.knobs = knobs
+        self.expressions = expressions
+        self.elements = elements
+        self.knob_expr = knob_expr
+        self.expr_element = expr_element
+        self._knob_ids = {name: i for i, name in enumerate(knobs)}
+
+    def expression_indices(self, *knobs: str) -> np.ndarray:
+        """Return the (sorted) indices of the expressions that depend on any of the knobs."""
+        unknown = [knob for knob in knobs if knob not in self._knob_ids]
+        if unknown:
+            raise KeyError(f"Unknown knobs: {unknown}")
+        ids = [self._knob_ids[knob] for knob in knobs]
+        return np.unique(self.knob_expr[np.isin(self.knob_expr[:, 0], ids), 1])
+
+    def affected_expressions(self, *knobs: str) -> list[str]:
+        """Return the names of the expressions that depend on any of the knobs."""
+        return [self.expressions[j] for j in self.expression_indices(*knobs)]
+
+    def affected_elements(self, *knobs: str) -> list[str]:
+        """Return the names of the elements with an attribute that depends on any of the knobs."""
+        elms = np.unique(self.expr_element[self.expression_indices(*knobs)])
+        return [self.elements[i] for i in elms if i >= 0]
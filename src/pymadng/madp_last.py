@@ -1,21 +1,86 @@
+import weakref
+
+
 class LastCounter:
     """Maintain a counter for anonymous '_last' variables in MAD-NG.
 
     The __last__ variable stores the most recent function result in MAD-NG.
-    This helper class tracks available temporary variable indices.
+    This helper class tracks available temporary variable indices, creating new ones when
+    all are in use, and remembers the released indices so that MAD-NG can clear them.
 
     Args:
-        size (int): The maximum number of temporary '_last' variables available.
+        size (int): The initial number of temporary '_last' variables available.
     """
 
     def __init__(self, size: int):
         self.counter = list(range(size, 0, -1))
+        self.size = size  # The number of indices created so far
+        self.released: set[int] = set()  # The indices still holding a value in MAD-NG
 
     def get(self):
-        assert len(self.counter) > 0, (
-            "Assigned too many anonymous variables, increase num_temp_vars or assign the variables into MAD"
-        )
-        return self.counter.pop()
+        if not self.counter:
+            self.size += 1
+            return self.size
+        idx = self.counter.pop()
+        self.released.discard(idx)  # It will be overwritten, no need to clear it
+        return idx
 
     def set(self, idx):
         self.counter.append(idx)
+        self.released.add(idx)
+
+    def flush(self) -> str:
+        """Return the MAD-NG code to clear the released variables, and forget them.
+
+        Returns:
+            str: The code to send to MAD-NG (empty if there is nothing to clear).
+        """
+        released, self.released = self.released, set()  # Swap, as __del__ may add to it
+        return "".join(f"_last[{idx}] = nil " for idx in sorted(released))
+
+
+class ReleaseQueue:
+    """Release named MAD-NG variables once their owning reference in Python is garbage collected.
+
+    The released variables are set to nil in MAD-NG with the next command, optionally followed
+    by an incremental garbage collection step. MAD-NG keeps the owned values in the weak table
+    ``__owned`` (see `MAD.own`), and a variable is only set to nil if it still holds its owned
+    value, so a variable reassigned by any command since is kept.
+
+    Args:
+        gc_step (bool): If True, run ``collectgarbage("step")`` in MAD-NG after releasing variables.
+    """
+
+    def __init__(self, gc_step: bool = False):
+        self.gc_step = gc_step
+        self.owners: dict[str, object] = {}  # The token of the current owner of each variable
+        self.released: list[str] = []
+
+    def own(self, ref) -> None:
+        """Make ref the owner of its variable, replacing any previous owner."""
+        token = object()
+        self.owners[ref._name] = token
+        if ref._name in self.released:  # The variable has been reassigned since its release
+            self.released.remove(ref._name)
+        weakref.finalize(ref, self.release, ref._name, token)
+
+    def release(self, name: str, token: object) -> None:
+        """Queue the variable to be set to nil, if token belongs to its current owner."""
+        if self.owners.get(name) is token:
+            del self.owners[name]
+            self.released.append(name)
+
+    def flush(self) -> str:
+        """Return the MAD-NG code to set the released variables to nil, and forget them.
+
+        Returns:
+            str: The code to send to MAD-NG (empty if there is nothing to release).
+        """
+        released, self.released = self.released, []  # Swap, as finalizers may add to it
+        if not released:
+            return ""
+        code = "".join(
+            f"if rawequal({name}, __owned[{name!r}]) then {name} = nil end __owned[{name!r}] = nil "
+            for name in released
+        )
+        return code + ('collectgarbage("step") ' if self.gc_step else "")
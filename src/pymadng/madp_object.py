@@ -1,26 +1,36 @@
 from __future__ import annotations  # For type hinting
 
 import platform
+from contextlib import contextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, TextIO  # To make stuff look nicer
 
+import numpy as np
+
 # Custom Classes:
+from .madp_buffers import TurnBuffer
+from .madp_cache import LUA_FINGERPRINT, ResultCache, result_key
 from .madp_classes import (
     MadFunc,
+    MadLastObject,
     MadLastRef,
     MadObject,
     MadRef,
+    fetch_keys,
+    join_strings,
+    unpack_keys,
 )
-from .madp_last import LastCounter
+from .madp_dependencies import LUA_MADX_DEPENDENCIES, LUA_RANDOM_GENERATORS, DependencyIndex
+from .madp_last import LastCounter, ReleaseQueue
 from .madp_pymad import MadProcess, is_private, type_fun
-from .madp_strings import format_kwargs_to_string
+from .madp_strings import format_kwargs_to_string, raw_field
+from .madp_tpsa import LUA_SEND_DAMAP, LUA_SEND_MONOMIALS, TPSA, DAMap, descriptor
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator, Mapping, Sequence
 
-    import numpy as np
+    from .madp_tpsa import Descriptor
 
-# TODO: Make it so that MAD does the loop for variables not python (speed) (jgray 2023)
 # TODO: Review recv_and exec:
 """
 Default arguments are evaluated once at module load time.
@@ -71,6 +81,7 @@ class MAD:
         redirect_stderr: bool = False,
         num_temp_vars: int = 8,
         ipython_use_jedi: bool = False,
+        gc_step_on_release: bool = False,
     ):
         """
         Initialise a MAD object for communication with MAD-NG.
@@ -85,8 +96,9 @@ class MAD:
             debug (bool, optional): If True, enables detailed debugging output.
             stdout (TextIO | str | Path | None, optional): Destination for MAD-NG's standard output.
             redirect_stderr (bool, optional): If True, redirects stderr to stdout.
-            num_temp_vars (int, optional): Maximum number of temporary variables to track.
+            num_temp_vars (int, optional): Initial number of temporary variables, more are created when needed.
             ipython_use_jedi (bool, optional): If True, allows IPython to use jedi for autocompletion.
+            gc_step_on_release (bool, optional): If True, run an incremental garbage collection step in MAD-NG after releasing owned variables (see `own`).
         """
         # ------------------------- Create the process --------------------------- #
         mad_path = mad_path or bin_path / ("mad_" + platform.system())
@@ -100,11 +112,17 @@ class MAD:
         )
         self.__process.ipython_use_jedi = ipython_use_jedi
         self.__process.last_counter = LastCounter(num_temp_vars)
+        self.__process.release_queue = ReleaseQueue(gc_step_on_release)
+        self.__process.pending_code_hooks.extend(
+            [self.__process.last_counter.flush, self.__process.release_queue.flush]
+        )
         # ------------------------------------------------------------------------ #
 
         ## Store the relavent objects into a function to get reference objects
         self.__get_MadReflast = lambda: MadLastRef(self.__process)
         self.__get_MadRef = lambda name: MadRef(name, self.__process)
+        self.__madx_dependencies: DependencyIndex | None = None  # See madx_dependencies
+        self.result_cache = ResultCache()  # See cached_result
 
         if not ipython_use_jedi:  # Stop jedi running getattr on my classes...
             try:
@@ -131,7 +149,8 @@ class MAD:
         self.load("MAD", *modules_to_import)
         self.__MAD_version__ = self.MAD.env.version
 
-        # Send a function to MAD-NG to create a list in the return or a single value
+        # Send functions to MAD-NG to create a list in the return or a single value, and to
+        # convert the numeric lists sent as vectors (see madp_strings) into tables
         self.send(
             """
 function __mklast__ (a, b, ...)
@@ -139,6 +158,11 @@ function __mklast__ (a, b, ...)
   else                     return {a, b, ...}
   end
 end
+function __mktbl__ (vec) -- Convert a vector of arguments received from Python into a table
+  local tbl = table.new(#vec, 0)
+  for i = 1, #vec do tbl[i] = vec[i] end
+  return tbl
+end
 _last = {}
   """
         )
@@ -200,6 +224,8 @@ _last = {}
         Returns:
             MAD: Returns self to facilitate method chaining.
         """
+        self.__process.dir_cache.clear()  # The data may be code that changes any table
+        self.__process.forget_values()
         self.__process.send(data)
         return self
 
@@ -273,6 +299,104 @@ _last = {}
         """
         self.__process.send_cpx_tpsa(monos, coefficients)
 
+    def send_damap(self, name: str, damap: DAMap, dense: bool = False):
+        """
+        Send a map to MAD-NG, as a damap named ``name``, in one message.
+
+        The monomials are sent once for all the components, as their indices in the order of
+        MAD-NG, followed by the matrix of the coefficients of each component. The order of
+        MAD-NG is received once per number of variables and order (see `Descriptor`).
+
+        Args:
+            name (str): The name of the damap in MAD-NG.
+            damap (DAMap): The map, with as many components as variables.
+            dense (bool, optional): If True, send the coefficients of every monomial in the order of MAD-NG, without the indices (smaller for dense high-order maps).
+        """
+        if len(damap) != damap.nv:
+            raise ValueError("A damap must have as many components as variables")
+        if np.iscomplexobj(damap.coefficients):
+            raise TypeError("Only real maps can be sent as a damap")
+        mad_rows = self.__monomial_rows(damap.descriptor)
+        self.protected_send(f"""
+do
+  local rows, mat = {self.py_name}:recv(), {self.py_name}:recv()
+  local nrow = rows and #rows or mat and mat:nrow() or 0 -- Without rows, mat is dense
+  MAD.gtpsad({damap.nv}, {damap.order})
+  local map = MAD.damap()
+  for j = 1, {len(damap)} do
+    local t = MAD.tpsa({damap.order})
+    for k = 1, nrow do t:set(rows and rows[k] + 1 or k, mat:get(k, j)) end
+    map[j] = t
+  end
+  {name} = map
+end""")
+        if dense:  # The rows in the order of MAD-NG
+            self.__process.send(None).send(np.ascontiguousarray(damap.coefficients[mad_rows]))
+            return
+        rows = np.flatnonzero(np.any(damap.coefficients != 0, axis=1))
+        if len(rows):
+            indices = np.argsort(mad_rows)[rows]  # The index of MAD-NG of each row
+            self.__process.send(indices.astype(np.int32).reshape(-1, 1))
+            self.__process.send(np.ascontiguousarray(damap.coefficients[rows]))
+        else:
+            self.__process.send(None).send(None)
+
+    def recv_damap(self, name: str, dense: bool = False) -> DAMap:
+        """
+        Retrieve a map (or a list of TPSAs) from MAD-NG in one message.
+
+        Fetching the components one by one sends the monomials of each; here the monomials
+        with a non-zero coefficient in any component are sent once, as indices in the order of
+        MAD-NG, followed by the matrix of the coefficients of each component. The order of
+        MAD-NG is received once per number of variables and order (see `Descriptor`).
+
+        Args:
+            name (str): The name of the map in MAD-NG (or an expression evaluating to it).
+            dense (bool, optional): If True, receive the coefficients of every monomial in the order of MAD-NG, without the indices (smaller for dense high-order maps); the monomials are those of the table of MAD-NG for the number of variables and the order.
+
+        Returns:
+            DAMap: The map, with one component per TPSA.
+        """
+        lua_dense = str(dense).lower()
+        self.protected_send(f"{LUA_SEND_DAMAP}\nsend_damap({self.py_name}, {name}, {lua_dense})")
+        nv, order, ncomp = (int(self.__process.recv()) for _ in range(3))
+        desc = descriptor(nv, order)
+        self.__process.send(desc.mad_rows is None)  # Whether the monomials must be sent first
+        monos = self.__process.recv()[0] if desc.mad_rows is None else None
+        rows, mat = self.__process.recv(), self.__process.recv()
+        if monos is not None:
+            desc.set_mad_monomials(monos)
+        dtype = np.float64 if mat is None else mat.dtype
+        coefficients = np.zeros((len(desc), ncomp), dtype)
+        if dense:
+            coefficients[desc.mad_rows] = mat
+        elif rows is not None:
+            coefficients[desc.mad_rows[rows.ravel()]] = mat
+        return DAMap(coefficients, nv, order)
+
+    def __monomial_rows(self, desc: Descriptor) -> np.ndarray:
+        """Return the row of the descriptor of each monomial of MAD-NG, received once."""
+        if desc.mad_rows is None:
+            self.protected_send(f"""
+{LUA_SEND_MONOMIALS}
+MAD.gtpsad({desc.nv}, {desc.order})
+send_monomials({self.py_name}, MAD.tpsa({desc.order}))""")
+            desc.set_mad_monomials(self.__process.recv()[0])
+        return desc.mad_rows
+
+    def recv_tpsa(self, name: str, dense: bool = False) -> TPSA:
+        """
+        Retrieve a TPSA from MAD-NG, with the coefficients of every monomial of its descriptor.
+
+        Args:
+            name (str): The name of the TPSA in MAD-NG (or an expression evaluating to it).
+            dense (bool, optional): If True, receive the coefficients of every monomial, without the indices of the monomials (see `recv_damap`).
+
+        Returns:
+            TPSA: The TPSA.
+        """
+        return self.recv_damap(f"{{ {name} }}", dense)[0]
+
     # ---------------------------------------------------------------------------------------------------------#
 
     # -------------------------------- Dealing with communication of variables --------------------------------#
@@ -317,7 +441,7 @@ _last = {}
             varnames = [x.strip("()") for x in dir(self.__get_MadRef(module))]
         for classname in varnames:
             script += f"""{classname} = {module}.{classname}\n"""
-        self.__process.send(script)
+        self.send(script)
 
     def loadfile(self, path: str | Path, *varnames: str):
         """
@@ -331,9 +455,7 @@ _last = {}
         """
         path: Path = Path(path).resolve()
         if varnames == ():
-            self.__process.send(
-                f"assert(loadfile('{path}', nil, {self.py_name}._env))()"
-            )
+            self.send(f"assert(loadfile('{path}', nil, {self.py_name}._env))()")
         else:
             # The parent/stem is necessary, otherwise the file will not be found
             # This is thanks to the way the require function works in MAD-NG (how it searches for files)
@@ -341,7 +463,7 @@ _last = {}
             script += f"local __req = require('{path.stem}')"
             for var in varnames:
                 script += f"{var} = __req.{var}\n"
-            self.__process.send(script)
+            self.send(script)
 
     # ----------------------- Make the class work with dict and dot access ------------------------#
     def __getattr__(self, item):
@@ -421,7 +543,92 @@ _last = {}
         Args:
             input (str): The MAD-X code to execute.
         """
-        self.__process.send("MADX:open_env()\n" + value + "\nMADX:close_env()")
+        self.send("MADX:open_env()\n" + value + "\nMADX:close_env()")
+
+    def madx_snapshot(self) -> tuple[list[str], np.ndarray]:
+        """
+        Capture the numeric variables of the MAD-X environment in one transfer.
+
+        Only the variables holding numbers are captured, not the deferred expressions.
+
+        Returns:
+            tuple[list[str], np.ndarray]: The names of the variables and their values, to give to `madx_restore`.
+        """
+        self.__process.protected_send(f"""
+do
+  local names, vals = {{}}, {{}}
+  for key, val in pairs(MADX) do
+    if type(key) == "string" and type(val) == "number" then
+      names[#names+1], vals[#vals+1] = key, val
+    end
+  end
+  {self.py_name}:send(table.concat(names, "\\n"))
+  {self.py_name}:send(#vals > 0 and MAD.vector(vals) or nil)
+end""")
+        names, vals = unpack_keys(self.__process.recv()), self.__process.recv()
+        return names, np.empty(0) if vals is None else vals.ravel()
+
+    def madx_restore(
+        self, snapshot: tuple[list[str], np.ndarray], only_changed: bool = True
+    ) -> None:
+        """
+        Restore the variables of the MAD-X environment captured by `madx_snapshot`, in one message.
+
+        The variables created since the snapshot are kept.
+
+        Args:
+            snapshot (tuple[list[str], np.ndarray]): The names and values returned by `madx_snapshot`.
+            only_changed (bool, optional): If True, only assign the variables that differ from the snapshot (including those replaced by deferred expressions).
+        """
+        names, vals = snapshot
+        if not names:
+            return
+        self.__process.protected_send(f"""
+do
+  local names, vals, current = {self.py_name}:recv(), {self.py_name}:recv(), {{}}
+  if {str(only_changed).lower()} then
+    for key, val in pairs(MADX) do current[key] = val end
+  end
+  local k = 0
+  for name in names:gmatch("[^\\n]+") do
+    k = k + 1
+    if current[name] ~= vals[k] then MADX[name] = vals[k] end
+  end
+end""")
+        self.__process.send("\n".join(names)).send(
+            np.asarray(vals, dtype=np.float64).reshape(-1, 1)
+        )
+
+    def madx_dependencies(self, refresh: bool = False) -> DependencyIndex:
+        """
+        Retrieve which deferred expressions and elements of the MAD-X environment depend on each knob.
+
+        The index is built in MAD-NG, by tracing the variables read by each expression, and is
+        cached: use refresh after loading a lattice or changing expressions.
+
+        As tracing evaluates the expressions with the current values of the knobs, a knob read
+        only in a branch that is not taken (e.g. ``a > 0 and b or c``) is not found. The random
+        generators (ranf, gauss, tgauss, ...) return 0 while tracing, so that their state is
+        unchanged, but any other side effect of an expression happens once per build.
+
+        Args:
+            refresh (bool, optional): If True, rebuild the index instead of using the cached one.
+
+        Returns:
+            DependencyIndex: The dependencies, as sparse index arrays.
+        """
+        if refresh or self.__madx_dependencies is None:
+            self.__process.protected_send(
+                f"{LUA_MADX_DEPENDENCIES}\nsend_madx_dependencies({self.py_name})"
+            )
+            names = [unpack_keys(self.__process.recv()) for _ in range(3)]
+            knob_expr, expr_element = self.__process.recv(), self.__process.recv()
+            self.__madx_dependencies = DependencyIndex(
+                *names,
+                np.empty((0, 2), dtype=np.int32) if knob_expr is None else knob_expr,
+                np.empty(0, dtype=np.int32) if expr_element is None else expr_element.ravel(),
+            )
+        return self.__madx_dependencies
 
     def quote_strings(self, value: str | list[str]) -> str | list[str]:
         """
@@ -463,12 +670,470 @@ _last = {}
             self.send(var)
         return rtrn
 
+    def scan(
+        self,
+        knobs: Mapping[str, Iterable[float]],
+        command: str,
+        observe: Sequence[str],
+        skip_errors: bool = False,
+    ) -> np.ndarray:
+        """
+        Run a command in MAD-NG for each point of a parameter scan, and record observables.
+
+        The points are sent in one matrix and the loop runs in MAD-NG, so the whole scan costs
+        a single round trip. The knobs are restored after the scan, to their initial values or
+        to their deferred expressions (which are not evaluated to be saved).
+
+        Args:
+            knobs (Mapping[str, Iterable[float]]): The values of each knob (e.g. ``"MADX.kqf"``) at each point, all of the same length N.
+            command (str): The MAD-NG expression to evaluate at each point, e.g. ``"twiss {sequence = seq}"``; its (first) result is called ``res``.
+            observe (Sequence[str]): The M values to record at each point; a name is a field of ``res`` (e.g. ``"q1"``), anything else a MAD-NG expression (e.g. ``"res.q1 - res.q2"``).
+            skip_errors (bool, optional): If True, the observables of the points where the command fails are NaN, instead of raising an error.
+
+        Returns:
+            np.ndarray: An N×M matrix of the observables at each point.
+        """
+        names = list(knobs)
+        if not names or not observe:
+            raise ValueError("A scan requires at least one knob and one observable")
+        columns = [np.asarray(values, dtype=np.float64).ravel() for values in knobs.values()]
+        npoint = len(columns[0])
+        if npoint == 0 or any(len(column) != npoint for column in columns):
+            raise ValueError("The knobs must have the same (non-zero) number of values")
+
+        save = "\n".join(f"  saved[{j}] = {raw_field(x)}" for j, x in enumerate(names, 1))
+        set_knobs = "\n".join(f"    {x} = grid:get(i, {j})" for j, x in enumerate(names, 1))
+        restore = "\n".join(f"    {x} = saved[{j}]" for j, x in enumerate(names, 1))
+        exprs = [f"res.{x}" if x.isidentifier() else x for x in observe]
+        record = "\n".join(f"    out:set(i, {j}, {x})" for j, x in enumerate(exprs, 1))
+        self.__process.protected_send(f"""
+do
+  local grid, out, saved = {self.py_name}:recv(), MAD.matrix({npoint}, {len(exprs)}), {{}}
+  local function rawfield (tbl, key) -- The value of a field, without evaluating it
+    if MAD.typeid.is_object(tbl) then return tbl:var_get(key) end
+    return rawget(tbl, key)
+  end
+{save}
+  local function run (i)
+{set_knobs}
+    local res = {command}
+{record}
+  end
+  local function restore ()
+{restore}
+  end
+  for i = 1, {npoint} do
+    local ok, err = pcall(run, i)
+    if not ok then
+      if not {str(skip_errors).lower()} then restore() error(err, 0) end
+      for j = 1, {len(exprs)} do out:set(i, j, 0/0) end
+    end
+  end
+  restore()
+  {self.py_name}:send(out)
+end""").send(np.column_stack(columns))
+        return self.__process.recv()
+
+    def eval_many(self, exprs: MadRef | str) -> np.ndarray:
+        """
+        Evaluate a list of deferred expressions in MAD-NG, and receive the values in one vector.
+
+        Args:
+            exprs (MadRef | str): A reference to (or the name of) a MAD-NG list of deferred expressions (functions) or numbers.
+
+        Returns:
+            np.ndarray: The value of each expression, NaN where it fails or is not a number.
+        """
+        self.__process.protected_send(f"""
+do
+  local exprs, vals = {getattr(exprs, "_name", exprs)}, {{}}
+  for i = 1, #exprs do
+    local ok, val = true, exprs[i]
+    if type(val) == "function" then ok, val = pcall(val) end
+    vals[i] = ok and type(val) == "number" and val or 0/0
+  end
+  {self.py_name}:send(#vals > 0 and MAD.vector(vals) or nil)
+end""")
+        vals = self.__process.recv()
+        return np.empty(0) if vals is None else vals.ravel()
+
+    def eval_deferred(
+        self, obj: MadRef | str, recursive: bool = True
+    ) -> tuple[list[str], np.ndarray]:
+        """
+        Evaluate the deferred expressions stored in a MAD-NG table (e.g. ``MADX``) in one transfer.
+
+        The functions of the table that return a number are evaluated in MAD-NG, and their
+        values are sent in one vector, with their names packed in one string. The random
+        generators (ranf, gauss, tgauss, ...) and the C functions are not expressions, and are
+        never called.
+
+        Args:
+            obj (MadRef | str): A reference to (or the name of) the MAD-NG table.
+            recursive (bool, optional): If True, also evaluate the expressions of the nested tables (e.g. the elements).
+
+        Returns:
+            tuple[list[str], np.ndarray]: The paths of the expressions relative to obj (e.g. ``"kqf"`` or ``"mq['k1']"``), and their values.
+        """
+        self.__process.protected_send(f"""
+do
+{LUA_RANDOM_GENERATORS}
+  local names, vals, seen = {{}}, {{}}, {{}}
+  local function path (prefix, key)
+    if type(key) ~= "string" then return string.format("%s[%s]", prefix or "", tostring(key))
+    elseif not key:match("^[%a_][%w_]*$") then return string.format("%s['%s']", prefix or "", key)
+    else return prefix and prefix .. "." .. key or key
+    end
+  end
+  local function collect (tbl, prefix)
+    seen[tbl] = true
+    for key, val in pairs(tbl) do
+      if type(key) == "string" and key:sub(1, 2) == "__" then -- skip the private keys
+      elseif type(val) == "function" and not random_generators[key]
+         and debug.getinfo(val, "S").what == "Lua" then
+        local ok, res = pcall(val)
+        if ok and type(res) == "number" then
+          names[#names+1], vals[#vals+1] = path(prefix, key), res
+        end
+      elseif {str(recursive).lower()} and type(val) == "table" and not seen[val] then
+        collect(val, path(prefix, key))
+      end
+    end
+  end
+  collect({getattr(obj, "_name", obj)})
+  {self.py_name}:send(table.concat(names, "\\n"))
+  {self.py_name}:send(#vals > 0 and MAD.vector(vals) or nil)
+end""")
+        names, vals = unpack_keys(self.__process.recv()), self.__process.recv()
+        return names, np.empty(0) if vals is None else vals.ravel()
+
+    def build_sequence(self, name: str, table: Any, **kwargs) -> MadObject:
+        """
+        Create a MAD-NG sequence from a table of elements, with one row per element.
+
+        The columns are sent packed (the numeric ones in one matrix, and each string column in
+        one string), and the elements and the sequence are created in a single loop in MAD-NG.
+
+        Args:
+            name (str): The name of the sequence (and of the variable to store it in).
+            table (Any): A data frame, structured array or dictionary of arrays, with the columns ``name`` and ``kind`` (e.g. ``"quadrupole"``), and one column per attribute (e.g. ``at``, ``l``, ``k1``). NaN values and empty strings are not set.
+            **kwargs: The attributes of the sequence (e.g. ``l``, ``refer="'entry'"``).
+
+        Returns:
+            MadObject: A reference to the sequence.
+        """
+        if getattr(table, "dtype", None) is not None and table.dtype.names:
+            columns = {key: table[key] for key in table.dtype.names}
+        elif hasattr(table, "columns"):  # A data frame
+            columns = {str(key): table[key].to_numpy() for key in table.columns}
+        else:
+            columns = dict(table)
+        columns = {key: np.asarray(col).ravel() for key, col in columns.items()}
+        if "name" not in columns or "kind" not in columns:
+            raise ValueError("The table must have the columns 'name' and 'kind'")
+        columns["name"], columns["kind"] = columns["name"].astype(str), columns["kind"].astype(str)
+
+        numnames, strnames = [], []
+        for key, col in columns.items():
+            if col.dtype.kind in "iuf":
+                numnames.append(key)
+            elif col.dtype.kind in "USO":
+                strnames.append(key)
+            else:
+                raise TypeError(f"Column '{key}' is neither numeric nor string")
+        nelm = len(columns["name"])
+        kwargs_string, vars_to_send = format_kwargs_to_string(self.py_name, **kwargs)
+        self.__process.protected_send(f"""
+do
+  local element, py = MAD.element, {self.py_name}
+  local seqdef, n = {kwargs_string}, {nelm}
+  local numnames, strnames = py:recv() or {{}}, py:recv() or {{}}
+  local mat, strcols = #numnames > 0 and n > 0 and py:recv(), {{}}
+  for j, key in ipairs(strnames) do -- unpack the strings from their byte offsets
+    local offsets, data, col = py:recv(), py:recv(), table.new(n, 0)
+    for i = 1, n do col[i] = data:sub(offsets[i] + 1, offsets[i + 1]) end
+    strcols[key] = col
+  end
+  local names, kinds = strcols.name, strcols.kind
+  for i = 1, n do
+    local attrs = {{}}
+    for j, key in ipairs(numnames) do
+      local val = mat:get(j, i)
+      if val == val then attrs[key] = val end -- skip NaN
+    end
+    for key, col in pairs(strcols) do
+      if key ~= "name" and key ~= "kind" and col[i] ~= "" then attrs[key] = col[i] end
+    end
+    local kind = element[kinds[i]] or error("unknown element kind '" .. kinds[i] .. "'")
+    seqdef[i] = kind(names[i])(attrs)
+  end
+  {name} = MAD.sequence "{name}" (seqdef)
+end""")
+        for var in vars_to_send:
+            self.__process.send(var)
+        self.__process.send(numnames).send(strnames)
+        if numnames and nelm:
+            self.__process.send(np.array([columns[key] for key in numnames], dtype=np.float64))
+        for key in strnames:
+            offsets, data = join_strings(columns[key])
+            self.__process.send(offsets).send(data)
+        return MadObject(name, self.__process)
+
+    def cached_result(
+        self,
+        command: str,
+        columns: list[str] | None = None,
+        state: str | None = None,
+        **kwargs,
+    ) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """
+        Run a command returning a table (e.g. ``twiss`` or ``survey``), unless its result is cached.
+
+        The result is cached in ``result_cache`` (see `ResultCache`) by a hash of the version of
+        MAD-NG, the command, its arguments and the state of the lattice. Unless given, the state
+        is a fingerprint computed by MAD-NG of the values of the arguments (e.g. the sequence and
+        the beam, given as references or as code), including the values of their deferred
+        expressions, so the key does not depend on the names of the arguments. The other functions
+        are identified without being called, and the random generators of ``MADX`` are not advanced.
+
+        Args:
+            command (str): The MAD-NG command to run, e.g. ``"twiss"``; its (first) result must be a table.
+            columns (list[str], optional): The columns to retrieve. Defaults to all the columns.
+            state (str, optional): A description of everything else the result depends on, replacing the fingerprint.
+            **kwargs: The arguments of the command (e.g. ``sequence=mad.seq``).
+
+        Returns:
+            tuple: The columns (as read-only arrays) and the scalar header values of the table.
+
+        Raises:
+            ValueError: If a state is given and the arguments refer to temporary results (``_last``), whose names are reused.
+        """
+        kwargs_string, vars_to_send = format_kwargs_to_string(self.py_name, **kwargs)
+        if state is None:
+            self.__process.protected_send(
+                f"{LUA_FINGERPRINT}\n{self.py_name}:send(fingerprint({kwargs_string}))"
+            )
+            for var in vars_to_send:
+                self.__process.send(var)
+            key = result_key(self.__MAD_version__, command, columns, self.__process.recv())
+        elif "_last[" in kwargs_string:
+            raise ValueError("The arguments must not be temporary results when a state is given")
+        else:
+            key = result_key(
+                self.__MAD_version__, command, kwargs_string, *vars_to_send, columns, state
+            )
+        result = self.result_cache.get(key)
+        if result is not None:
+            return result
+
+        table = MadLastObject(self.__process)
+        self.__process.protected_send(f"{table._name} = ({command} {kwargs_string})")
+        for var in vars_to_send:
+            self.__process.send(var)
+        fetched = table.fetch_columns(columns)
+        self.__process.protected_send(f"""
+local is_number, is_string, is_boolean, is_complex in MAD.typeid
+local tbl, hdr = {table._name}, {{}}
+for _, attr in ipairs(tbl.header) do
+  local val = tbl[attr]
+  if is_number(val) or is_string(val) or is_boolean(val) or is_complex(val) then
+    hdr[attr] = val
+  end
+end
+{self.py_name}:send(hdr, true)""")
+        return self.result_cache.put(key, fetched, self.__process.recv() or {})
+
+    def track_stream(
+        self, sequence: MadRef | str, buffer: int | np.ndarray, every: int = 1, **kwargs
+    ) -> TurnBuffer:
+        """
+        Track particles over many turns, streaming their coordinates into a ring buffer.
+
+        MAD-NG sends the coordinates of all the particles as one matrix at the end of every
+        ``every`` turns, while Python writes them into the buffer, so the memory used is bounded
+        by the size of the buffer instead of the number of turns. The tracking table is not
+        saved unless requested, and the ``atexit`` action of the track command is used.
+
+        Args:
+            sequence (MadRef | str): The sequence to track through (or its name in MAD-NG).
+            buffer (int | np.ndarray): The number of turns to keep, or an array of shape (turns, particles, 6) to write to, e.g. ``numpy.lib.format.open_memmap`` for a file on disk.
+            every (int, optional): Only record one turn in ``every`` turns.
+            **kwargs: The other arguments of the track command, e.g. ``beam``, ``X0`` and ``nturn``.
+
+        Returns:
+            TurnBuffer: The buffer, holding the coordinates of the last recorded turns.
+        """
+        if every < 1:
+            raise ValueError("every must be a positive number of turns")
+        seq_name = sequence._name if isinstance(sequence, MadRef) else sequence
+        kwargs.setdefault("save", False)
+        kwargs_string, vars_to_send = format_kwargs_to_string(self.py_name, **kwargs)
+        self.__process.protected_send(f"""
+do
+  local py, seq, every = {self.py_name}, {seq_name}, {every}
+  local last, turn = seq[#seq], 0
+  local args = {kwargs_string}
+  args.sequence = seq
+  args.atexit = function (elm, mflw) -- Send the coordinates at the end of each recorded turn
+    if elm ~= last then return end
+    turn = turn + 1
+    if turn % every ~= 0 then return end
+    local tpar = mflw.tpar or mflw.npar
+    local mat = MAD.matrix(6, tpar)
+    for k = 1, 6 * tpar do mat[k] = 0/0 end -- The lost particles are NaN
+    for i = 1, mflw.npar do
+      local p = mflw[i]
+      local j = p.id or i
+      mat:set(1, j, p.x)  mat:set(2, j, p.px)
+      mat:set(3, j, p.y)  mat:set(4, j, p.py)
+      mat:set(5, j, p.t)  mat:set(6, j, p.pt)
+    end
+    py:send(mat)
+  end
+  MAD.track(args)
+  py:send(nil) -- The end of the stream
+end""")
+        for var in vars_to_send:
+            self.__process.send(var)
+
+        ring, turn, error = TurnBuffer(buffer), 0, None
+        while (coords := self.__process.recv()) is not None:
+            turn += every
+            if error is None:  # Keep reading the stream after an error, to leave the pipe clear
+                try:
+                    ring.append(turn, coords.T)
+                except ValueError as err:
+                    error = err
+        if error is not None:
+            raise ValueError(f"Cannot write the coordinates into the buffer: {error}") from error
+        if hasattr(ring.data, "flush"):
+            ring.data.flush()  # Write a memory-mapped buffer to disk
+        return ring
+
+    def track_bulk(
+        self, sequence: MadRef | str, x0: np.ndarray, chunk_size: int = 100_000, **kwargs
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Track many particles, sending their initial coordinates as matrices.
+
+        The particles are sent in chunks of ``chunk_size`` rows, each one expanded into the
+        particle list of the track command by MAD-NG, to bound the memory used by MAD-NG. The
+        tracking table is not saved unless requested.
+
+        Args:
+            sequence (MadRef | str): The sequence to track through (or its name in MAD-NG).
+            x0 (np.ndarray): The initial coordinates, one row of x, px, y, py, t, pt per particle.
+            chunk_size (int, optional): The number of particles tracked at once.
+            **kwargs: The other arguments of the track command, e.g. ``beam`` and ``nturn``.
+
+        Returns:
+            tuple: The final coordinates (at the loss for the lost particles), with the same shape as x0, and a boolean array of the particles that survived.
+        """
+        x0 = np.asarray(x0, dtype=np.float64)
+        if x0.ndim != 2 or x0.shape[1] != 6:
+            raise ValueError(f"x0 must have one row of 6 coordinates per particle, not {x0.shape}")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number of particles")
+        seq_name = sequence._name if isinstance(sequence, MadRef) else sequence
+        starts = range(0, len(x0), chunk_size)
+        kwargs.setdefault("save", False)
+        kwargs_string, vars_to_send = format_kwargs_to_string(self.py_name, **kwargs)
+        self.__process.protected_send(f"""
+do
+  local py, args = {self.py_name}, {kwargs_string}
+  args.sequence = {seq_name}
+  py:send(true) -- Ready for the particles, which are only sent once the arguments are valid
+  for _ = 1, {len(starts)} do
+    local X, X0 = py:recv(), {{}}
+    local n = X:nrow()
+    for i = 1, n do
+      X0[i] = {{
+        x = X:get(i, 1), px = X:get(i, 2), y = X:get(i, 3),
+        py = X:get(i, 4), t = X:get(i, 5), pt = X:get(i, 6),
+      }}
+    end
+    args.X0 = X0
+    local _, mflw = MAD.track(args)
+    local out, alive = MAD.matrix(n, 6), MAD.imatrix(n, 1)
+    for i = 1, n do -- The lost particles are moved after the others
+      local p = mflw[i]
+      if p then
+        local j = p.id or i
+        out:set(j, 1, p.x)  out:set(j, 2, p.px)  out:set(j, 3, p.y)
+        out:set(j, 4, p.py) out:set(j, 5, p.t)   out:set(j, 6, p.pt)
+        alive:set(j, 1, i <= mflw.npar and 1 or 0)
+      end
+    end
+    py:send(out)
+    py:send(alive)
+  end
+end""")
+        for var in vars_to_send:
+            self.__process.send(var)
+
+        final, alive = np.empty_like(x0), np.empty(len(x0), dtype=bool)
+        self.__process.recv()  # Raises the errors of the arguments before any chunk is sent
+        for start in starts:
+            chunk = slice(start, start + chunk_size)
+            self.__process.send(np.ascontiguousarray(x0[chunk]))
+            final[chunk] = self.__process.recv()
+            alive[chunk] = self.__process.recv().ravel() != 0
+        return final, alive
+
     def __dir__(self) -> Iterable[str]:
         py_objs = [x for x in super().__dir__() if x[0] != "_"]
-        py_objs.extend(self.globals())
-        py_objs.extend(dir(self.recv_vars("_G", shallow_copy=True)))
+        py_objs.extend(fetch_keys(self.__process, f"{self.py_name}._env", "_G"))
         return py_objs
 
+    def own(self, *names: str) -> Any:
+        """
+        Take ownership of MAD-NG variables, so they are released once unused in Python.
+
+        Returns references to the variables; once a returned reference is garbage collected,
+        the variable is set to nil in MAD-NG with the next command, freeing its memory, unless
+        it has been reassigned since (e.g. by ``mad.send``). Other references to the same
+        variable do not keep it alive, and values that are not references (e.g. numbers) are
+        returned as is, without ownership.
+
+        Args:
+            *names (str): The names of the variables to own.
+
+        Returns:
+            The reference (or value) of each variable, or a tuple if multiple names are provided.
+        """
+        values = [self.__process.recv_vars(name) for name in names]
+        refs = [value for value in values if isinstance(value, MadRef)]
+        if refs:  # Record the owned values, to only release the variables still holding them
+            self.__process.protected_send(
+                "__owned = __owned or setmetatable({}, {__mode = 'v'}) "
+                + "".join(f"__owned[{ref._name!r}] = {ref._name} " for ref in refs)
+            )
+        for ref in refs:
+            self.__process.release_queue.own(ref)
+        return values[0] if len(values) == 1 else tuple(values)
+
+    @contextmanager
+    def cached(self) -> Iterator[MAD]:
+        """
+        Cache the scalar values read from MAD-NG (e.g. ``mad.MADX.nrj``) within a ``with`` block.
+
+        A value read again is returned without a round trip, until Python may have changed it:
+        assigning a global removes its value and the values of all fields, assigning a field or
+        sending any command (e.g. ``mad.send``) removes all the values. The cache is emptied when
+        leaving the block.
+
+        Example:
+            >>> with mad.cached():
+            ...     energies = [mad.MADX.nrj for _ in range(10)]  # One round trip
+        """
+        previous = self.__process.value_cache
+        if previous is None:
+            self.__process.value_cache = {}
+        try:
+            yield self
+        finally:
+            self.__process.value_cache = previous
+
     def globals(self) -> list[str]:
         """
         Retrieve a list of all global variable names in the MAD-NG environment.
@@ -476,7 +1141,7 @@ _last = {}
         Returns:
             list[str]: A list containing the names of global variables.
         """
-        return dir(self.__process.recv_vars(f"{self.py_name}._env", shallow_copy=True))
+        return sorted(fetch_keys(self.__process, f"{self.py_name}._env"))
 
     def history(self) -> str:
         """
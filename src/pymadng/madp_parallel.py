@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from .madp_object import MAD
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Mapping, Sequence
+
+# Number of chunks per worker, so that the workers with cheaper points take on more chunks
+CHUNKS_PER_WORKER = 8
+
+
+def parallel_scan(
+    setup_script: str | Callable[[MAD], Any],
+    grid: Mapping[str, Iterable[float]],
+    command: str,
+    observe: Sequence[str],
+    workers: int | None = None,
+    chunk_size: int | None = None,
+    callback: Callable[[np.ndarray, np.ndarray], Any] | None = None,
+    skip_errors: bool = False,
+    **mad_kwargs,
+) -> np.ndarray:
+    """Run a parameter scan over a grid of knob values, shared across several MAD-NG processes.
+
+    Each worker starts its own MAD-NG process, runs the setup (e.g. loading the lattice), and then
+    takes chunks of points from a shared queue until none are left, running each chunk with
+    ``MAD.scan``. The workers that finish their chunks early take the remaining ones, so uneven
+    costs between points are balanced.
+
+    Args:
+        setup_script (str | Callable[[MAD], Any]): The MAD-NG code to run in each process before the scan, or a function called with each MAD object.
+        grid (Mapping[str, Iterable[float]]): The values of each knob, the scan covers every combination of these values.
+        command (str): The MAD-NG expression to evaluate at each point (see ``MAD.scan``).
+        observe (Sequence[str]): The M values to record at each point (see ``MAD.scan``).
+        workers (int, optional): The number of MAD-NG processes. Defaults to the number of CPUs.
+        chunk_size (int, optional): The number of points per chunk. Defaults to a few chunks per worker.
+        callback (Callable[[np.ndarray, np.ndarray], Any], optional): Called with the grid indices (one row per point) and the observables of each chunk once it completes, for streaming the results.
+        skip_errors (bool, optional): If True, the observables of the points where the command fails are NaN, instead of raising an error.
+        **mad_kwargs: Keyword arguments for the MAD objects (e.g. ``mad_path``).
+
+    Returns:
+        np.ndarray: The observables, of shape (*grid lengths, M), in grid order.
+    """
+    names = list(grid)
+    axes = [np.asarray(values, dtype=np.float64).ravel() for values in grid.values()]
+    shape = tuple(len(axis) for axis in axes)
+    points = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+    npoint = len(points)
+    if npoint == 0:
+        raise ValueError("The grid must have at least one point")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, npoint))
+    chunk_size = chunk_size or -(-npoint // (workers * CHUNKS_PER_WORKER))
+    chunks: queue.SimpleQueue[int] = queue.SimpleQueue()
+    for start in range(0, npoint, chunk_size):
+        chunks.put(start)
+
+    results = np.empty((npoint, len(observe)))
+    failed = threading.Event()  # Stop the other workers if one of them fails
+    callback_lock = threading.Lock()
+
+    def run_chunks(mad: MAD) -> None:
+        while not failed.is_set():
+            try:
+                start = chunks.get_nowait()
+            except queue.Empty:
+                return
+            stop = min(start + chunk_size, npoint)
+            knobs = dict(zip(names, points[start:stop].T))
+            results[start:stop] = mad.scan(knobs, command, observe, skip_errors)
+            if callback is not None:
+                with callback_lock:
+                    indices = np.unravel_index(np.arange(start, stop), shape)
+                    callback(np.column_stack(indices), results[start:stop])
+
+    def work() -> None:
+        try:
+            with MAD(**mad_kwargs) as mad:
+                if callable(setup_script):
+                    setup_script(mad)
+                else:
+                    mad.protected_send(setup_script)
+                run_chunks(mad)
+        except BaseException:
+            failed.set()
+            raise
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work) for _ in range(workers)]
+    for future in futures:
+        future.result()  # Raise the error of any failed worker
+    return results.reshape(*shape, len(observe))
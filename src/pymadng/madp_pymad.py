@@ -19,6 +19,8 @@ if TYPE_CHECKING:
 
     from numpy.typing import DTypeLike
 
+    from .madp_buffers import TableBuffer
+
 # TODO: look at cpymad for the suppression of the error messages at exit - copy? (jgray 2024)
 
 
@@ -115,6 +117,20 @@ class MadProcess:
         self.history = ""  # Begin the recording of the history
         self.debug = debug  # Record debug mode status
 
+        # Functions returning MAD-NG code to run before the next command (e.g. releasing variables)
+        self.pending_code_hooks: list[Callable[[], str]] = []
+
+        # Keys of MAD-NG tables, by name, kept for dir until Python may have changed them
+        self.dir_cache: dict[str, list[str]] = {}
+
+        # Scalar values of MAD-NG variables, by name, kept until Python may have changed them,
+        # or None when the values are not cached (see MAD.cached)
+        self.value_cache: dict[str, Any] | None = None
+
+        # Rows of the MAD-NG tables received by MadObject.sync, by name, so that the references
+        # created on each access (e.g. mad.tbl) continue from the rows already received
+        self.sync_buffers: dict[str, TableBuffer] = {}
+
         # stdout should be line buffered by default, but for jupyter notebook,
         # stdout is redirected and not line buffered by default
         self.send("io.stdout:setvbuf('line')")
@@ -198,11 +214,26 @@ class MadProcess:
                 f"Unsupported data type, expected a type in: \n{list(type_str.keys())}, got {type(data)}"
             ) from None
 
-    def protected_send(self, string: str) -> MadProcess:
+    def pending_code(self) -> str:
+        """Collect the code queued by the pending code hooks, to prepend to the next command.
+
+        Returns:
+            str: The MAD-NG code to run before the next command.
+        """
+        return "".join(hook() for hook in self.pending_code_hooks)
+
+    def protected_send(self, string: str, invalidate: bool = True) -> MadProcess:
         """Send a command string to MAD-NG with temporary error handling.
 
         If error handling is enabled, any errors in MAD-NG will be reported back.
+        Args:
+            string (str): The command to send.
+            invalidate (bool): If False, keep the cached keys and values, for commands that only read MAD-NG (e.g. introspection).
         """
+        string = self.pending_code() + string
+        if invalidate:
+            self.dir_cache.clear()  # Any command may change the keys of any table
+            self.forget_values()
         if self.raise_on_madng_error:
             # If the user has specified that they want to raise an error always, skip the error handling on and off
             return self.send(string)
@@ -222,13 +253,21 @@ class MadProcess:
         Returns:
             The value of the variable.
         """
-        lua_shallow = str(shallow_copy).lower()
+        if self.value_cache is not None and name in self.value_cache:
+            return self.value_cache[name]
+        lua_shallow, pending = str(shallow_copy).lower(), self.pending_code()
         if self.raise_on_madng_error:
-            return self.send(f"{self.py_name}:send({name}, {lua_shallow})").recv(name)
-        self.send(
-            f"{self.py_name}:__err(true):send({name}, {lua_shallow}):__err(false)"
-        )  # Enable error handling, ask for the variable, and disable error handling
-        return self.recv(name)
+            self.send(f"{pending}{self.py_name}:send({name}, {lua_shallow})")
+        else:
+            self.send(
+                f"{pending}{self.py_name}:__err(true):send({name}, {lua_shallow}):__err(false)"
+            )  # Enable error handling, ask for the variable, and disable error handling
+        value = self.recv(name)
+        if self.value_cache is not None and isinstance(
+            value, str | bool | int | float | complex | np.number | np.bool_
+        ):
+            self.value_cache[name] = value  # Only immutable values, not references
+        return value
 
     def set_error_handler(self, on_off: bool) -> None:
         """Toggle error handling in the MAD-NG process.
@@ -288,12 +327,47 @@ class MadProcess:
             MadProcess: Returns self to allow method chaining.
         """
         for name, var in variables.items():
+            self.forget_keys(name)
+            self.forget_values(name)
+            pending = self.pending_code()
             if isinstance(var, BaseMadRef):
-                self.send(f"{name} = {var._name}")
+                self.send(f"{pending}{name} = {var._name}")
             else:
-                self.send(f"{name} = {self.py_name}:recv()").send(var)
+                self.send(f"{pending}{name} = {self.py_name}:recv()").send(var)
         return self
 
+    def forget_keys(self, name: str) -> None:
+        """Remove the cached keys (see dir_cache) that an assignment to a variable may change.
+
+        Args:
+            name (str): The MAD-NG variable (or field) being assigned.
+        """
+        if "[" in name or "." in name:
+            # Objects inherit the keys of their parents, so any cached keys may change
+            self.dir_cache.clear()
+            return
+        # A global only changes the global keys and the keys of what it replaces
+        changed = ("_G", f"{self.py_name}._env", name)
+        for key in list(self.dir_cache):
+            if key in changed or key.startswith((f"{name}[", f"{name}.")):
+                del self.dir_cache[key]
+
+    def forget_values(self, name: str | None = None) -> None:
+        """Remove the cached values (see value_cache) that an assignment to a variable may change.
+
+        Args:
+            name (str, optional): The MAD-NG global being assigned. Defaults to any change, such as a field assignment or a command, which removes all the values.
+        """
+        if not self.value_cache:
+            return
+        if name is None or "[" in name or "." in name:
+            self.value_cache.clear()
+            return
+        # Fields may be deferred expressions of the global, but a global cannot depend on another
+        for key in list(self.value_cache):
+            if key == name or "[" in key or "." in key:
+                del self.value_cache[key]
+
     def recv_vars(self, *names, shallow_copy: bool = False) -> Any:
         """Receive one or multiple variables from MAD-NG.
 
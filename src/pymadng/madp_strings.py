@@ -1,14 +1,21 @@
+import math
+import re
 from typing import Any
 
+import numpy as np
+
 from .madp_pymad import BaseMadRef
 
+# Lists of at least this many numbers are sent as one vector, converted to a table by __mktbl__
+VECTOR_LIST_MIN_LENGTH = 16
+
 
 # Keep an eye out for failures when kwargs is empty, shouldn't occur in current setup (jgray 2023)
 def format_kwargs_to_string(py_name, **kwargs):
     """Convert a keyword argument input to a string used by MAD-NG
 
     The function produces a Lua table-like string representation of the arguments and
-    gathers any non-string items in a list for separate sending.
+    gathers any items that cannot be written as code in a list for separate sending.
 
     Args:
         py_name (str): The name of the Python reference variable in MAD-NG.
@@ -17,16 +24,9 @@ def format_kwargs_to_string(py_name, **kwargs):
     Returns:
         tuple: A tuple with the formatted string and a list of variables to send.
     """
-    formatted_kwargs = "{"
-    vars_to_send = []
-    for key, item in kwargs.items():
-        formatted_key = str(key).replace("'", "")
-        formatted_item, var_to_send = create_mad_string(py_name, item)
-        formatted_kwargs += formatted_key + " = " + formatted_item + ", "
-        vars_to_send.extend(var_to_send)
-
-    # Add the closing bracket and return
-    return formatted_kwargs + "}", vars_to_send
+    parts, vars_to_send = [], []
+    write_kwargs(py_name, kwargs, parts, vars_to_send)
+    return "".join(parts), vars_to_send
 
 
 def format_args_to_string(py_name, *args):
@@ -44,15 +44,9 @@ def format_args_to_string(py_name, *args):
     Returns:
         tuple: A tuple containing the composed argument string and a list of variables to send.
     """
-    mad_string = ""
-    vars_to_send = []
-    for arg in args:
-        formatted_arg, var_to_send = create_mad_string(py_name, arg)
-        mad_string += formatted_arg + ", "
-        vars_to_send.extend(var_to_send)
-
-    # Remove the last comma and space
-    return mad_string[:-2], vars_to_send
+    parts, vars_to_send = [], []
+    write_args(py_name, args, parts, vars_to_send)
+    return "".join(parts), vars_to_send
 
 
 def create_mad_string(py_name, var: Any):
@@ -61,7 +55,8 @@ def create_mad_string(py_name, var: Any):
 
     Convert a Python variable to its MAD-NG string representation.
 
-    Handles lists, dictionaries, strings, and MAD references. For non-string or non-primitive
+    Handles lists, dictionaries, strings, numbers and MAD references. Finite numbers are written
+    as exact (hexadecimal) literals and long numeric lists are sent as a single vector. For other
     types, it falls back on using a receive call.
 
     Args:
@@ -71,17 +66,78 @@ def create_mad_string(py_name, var: Any):
     Returns:
         tuple: A tuple containing the formatted string and a list of associated variables.
     """
+    parts, vars_to_send = [], []
+    write_value(py_name, var, parts, vars_to_send)
+    return "".join(parts), vars_to_send
+
+
+# The writers below append to a list of string parts, joined once, to stay linear in the input size
+def write_kwargs(py_name, kwargs: dict, parts: list[str], vars_to_send: list):
+    """Append the MAD-NG table for the keyword arguments to parts (see format_kwargs_to_string)."""
+    parts.append("{")
+    for key, item in kwargs.items():
+        parts.append(str(key).replace("'", "") + " = ")
+        write_value(py_name, item, parts, vars_to_send)
+        parts.append(", ")
+    parts.append("}")
+
+
+def write_args(py_name, args, parts: list[str], vars_to_send: list):
+    """Append the comma separated arguments to parts (see format_args_to_string)."""
+    for i, arg in enumerate(args):
+        if i:
+            parts.append(", ")
+        write_value(py_name, arg, parts, vars_to_send)
+
+
+def write_value(py_name, var: Any, parts: list[str], vars_to_send: list):
+    """Append the MAD-NG representation of a variable to parts (see create_mad_string)."""
     if isinstance(var, list):
-        string, vars_to_send = format_args_to_string(py_name, *var)
-        return "{" + string + "}", vars_to_send
-    if var is None:
-        return "nil", []
-    if isinstance(var, str):
-        return var, []
-    if isinstance(var, BaseMadRef):
-        return var._name, []
-    if isinstance(var, dict):
-        return format_kwargs_to_string(py_name, **var)
-    if isinstance(var, bool):
-        return str(var).lower(), []
-    return f"{py_name}:recv()", [var]
+        if len(var) >= VECTOR_LIST_MIN_LENGTH and is_numeric_list(var):
+            parts.append(f"__mktbl__({py_name}:recv())")
+            vars_to_send.append(np.array(var, dtype=np.float64).reshape(-1, 1))
+        else:
+            parts.append("{")
+            write_args(py_name, var, parts, vars_to_send)
+            parts.append("}")
+    elif var is None:
+        parts.append("nil")
+    elif isinstance(var, str):
+        parts.append(var)
+    elif isinstance(var, BaseMadRef):
+        parts.append(var._name)
+    elif isinstance(var, dict):
+        write_kwargs(py_name, var, parts, vars_to_send)
+    elif isinstance(var, bool):
+        parts.append(str(var).lower())
+    elif isinstance(var, int | np.integer):
+        parts.append(str(int(var)))
+    elif isinstance(var, float | np.floating) and math.isfinite(var):
+        parts.append(float.hex(float(var)))  # Exact, unlike the decimal representation
+    else:
+        parts.append(f"{py_name}:recv()")
+        vars_to_send.append(var)
+
+
+def is_numeric_list(lst: list) -> bool:
+    """Check if all the items of a list are real numbers (booleans excluded)."""
+    return all(
+        isinstance(x, int | float | np.integer | np.floating) and not isinstance(x, bool)
+        for x in lst
+    )
+
+
+def raw_field(name: str) -> str:
+    """Convert the name of a MAD-NG variable to code reading its value without evaluating it.
+
+    A field (e.g. ``MADX.kqf`` or ``seq['qf'].k1``) is read with ``rawfield(parent, key)``,
+    which must be defined by the calling code, so that a deferred expression is read as the
+    function itself instead of its value. A global is read as is.
+    """
+    match = re.fullmatch(r"(.+)\.([A-Za-z_]\w*)", name)
+    if match:
+        return f"rawfield({match[1]}, '{match[2]}')"
+    match = re.fullmatch(r"(.+)\[([^\[\]]+)\]", name)
+    if match:
+        return f"rawfield({match[1]}, {match[2]})"
+    return name
@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+import functools
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Sequence
+
+# Lua function to send the monomials of the descriptor of a TPSA up to its order, in the order
+# of MAD-NG, as a TPSA with all its coefficients set to one
+LUA_SEND_MONOMIALS = """
+local function send_monomials (py, tpsa)
+  local nv, mo = tpsa.d.nv, tpsa.mo
+  local t, nc = tpsa:same(mo), 1
+  for k = 1, mo do nc = nc * (nv + k) / k end
+  for i = 1, nc do t:set(i, 1) end
+  py:send(t)
+end
+"""
+
+# Lua function to send the components of a map (or a list of TPSAs) in one message: the
+# (0-based) indices of the monomials with a non-zero coefficient in any component, in the order
+# of MAD-NG, and the matrix of their coefficients, one column per component. If dense, the
+# indices are skipped (nil) and the coefficients of every monomial are sent. The monomials of
+# the descriptor are sent first if Python does not know their order yet
+LUA_SEND_DAMAP = (
+    LUA_SEND_MONOMIALS
+    + """
+local function send_damap (py, map, dense)
+  local is_ctpsa in MAD.typeid
+  local n, nv, mo, top = #map, map[1].d.nv, -1, nil
+  for j = 1, n do
+    if map[j].mo > mo then mo, top = map[j].mo, map[j] end
+  end
+  py:send(nv) py:send(mo) py:send(n)
+  if py:recv() then send_monomials(py, top) end
+  local nc = 1 -- The number of monomials up to the order, (nv + mo)! / (nv! mo!)
+  for k = 1, mo do nc = nc * (nv + k) / k end
+  local rows = {}
+  for i = 1, nc do
+    for j = 1, n do
+      if dense or map[j]:get(i) ~= 0 then rows[#rows+1] = i break end
+    end
+  end
+  local idx, mat
+  if #rows > 0 then
+    idx = not dense and MAD.imatrix(#rows, 1) or nil
+    mat = (is_ctpsa(map[1]) and MAD.cmatrix or MAD.matrix)(#rows, n)
+    for k, i in ipairs(rows) do
+      if idx then idx:set(k, 1, i - 1) end
+      for j = 1, n do mat:set(k, j, map[j]:get(i)) end
+    end
+  end
+  py:send(idx) py:send(mat)
+end
+"""
+)
+
+# The number of points evaluated at once, to bound the memory used by the table of monomials
+EVAL_CHUNK_SIZE = 4096
+
+
+def _exponents(degree: int, nv: int) -> Iterator[tuple[int, ...]]:
+    """Yield the exponents of the monomials of a degree in nv variables, in descending order."""
+    if nv == 1:
+        yield (degree,)
+        return
+    for first in range(degree, -1, -1):
+        for rest in _exponents(degree - first, nv - 1):
+            yield (first, *rest)
+
+
+def _keys(monos: np.ndarray) -> np.ndarray:
+    """View each monomial (row of exponents) as one comparable value."""
+    monos = np.ascontiguousarray(monos, dtype=np.uint8)
+    return monos.view(np.dtype((np.void, monos.shape[1]))).ravel()
+
+
+class Descriptor:
+    """The monomials of the TPSAs in nv variables up to an order.
+
+    The monomials are sorted by degree (``100``, ``010``, ``001``, ``200``, ``110``, ...), so
+    the monomials up to a lower order are the first rows of the table. Within a degree, the
+    order may differ from the one of MAD-NG, so the coefficients are exchanged with MAD-NG
+    along with their monomials, or through ``mad_rows``, the row of the monomial at each
+    (0-based) index of MAD-NG, received once from MAD-NG when first needed (see
+    `MAD.recv_damap`). Descriptors are cached, use `descriptor` to create them.
+    """
+
+    def __init__(self, nv: int, order: int):
+        self.nv, self.order = nv, order
+        exponents = [mono for deg in range(order + 1) for mono in _exponents(deg, nv)]
+        self.monos = np.array(exponents, dtype=np.uint8).reshape(-1, nv)
+        self.monos.flags.writeable = False
+        degrees = self.monos.sum(axis=1)
+        self.starts = np.searchsorted(degrees, np.arange(order + 2))  # The first row of each degree
+
+        keys = _keys(self.monos)
+        self._sorter = np.argsort(keys)
+        self._sorted_keys = keys[self._sorter]
+
+        # Each monomial is the product of a monomial of the previous degree and a variable
+        self.variables = np.argmax(self.monos > 0, axis=1)
+        lower = self.monos.astype(np.int16)
+        lower[np.arange(len(lower)), self.variables] -= 1
+        self.parents = np.full(len(lower), -1)
+        self.parents[1:] = self.index(lower[1:].astype(np.uint8))
+        self._products: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self.mad_rows: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.monos)
+
+    def set_mad_monomials(self, monos: np.ndarray) -> None:
+        """Record the order of MAD-NG, from its monomials up to the order (see ``mad_rows``).
+
+        Raises:
+            ValueError: If the monomials are not those of the descriptor.
+        """
+        rows = self.index(monos)
+        if len(rows) != len(self) or (rows < 0).any() or len(np.unique(rows)) != len(self):
+            raise ValueError(
+                f"The monomials of MAD-NG do not match those of {self.nv} variables up to order "
+                f"{self.order}"
+            )
+        rows.flags.writeable = False
+        self.mad_rows = rows
+
+    def index(self, monos: np.ndarray) -> np.ndarray:
+        """Return the row of each monomial in the table, or -1 if its degree is above the order."""
+        monos = np.asarray(monos, dtype=np.uint8).reshape(-1, self.nv)
+        keys = _keys(monos)
+        pos = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self) - 1)
+        found = self._sorted_keys[pos] == keys
+        return np.where(found, self._sorter[pos], -1)
+
+    def products(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the rows (i, j, k) such that monos[i] * monos[j] = monos[k], up to the order."""
+        if self._products is None:
+            rows_i, rows_j, rows_k = [], [], []
+            for deg_i in range(self.order + 1):
+                for deg_j in range(self.order - deg_i + 1):
+                    i = np.arange(self.starts[deg_i], self.starts[deg_i + 1])
+                    j = np.arange(self.starts[deg_j], self.starts[deg_j + 1])
+                    i, j = np.repeat(i, len(j)), np.tile(j, len(i))
+                    rows_i.append(i)
+                    rows_j.append(j)
+                    rows_k.append(self.index(self.monos[i] + self.monos[j]))
+            self._products = tuple(np.concatenate(rows) for rows in (rows_i, rows_j, rows_k))
+        return self._products
+
+    def multiply(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Multiply the dense coefficients of two TPSAs of this descriptor, truncating the result."""
+        i, j, k = self.products()
+        weights = a[i] * b[j]
+        if np.iscomplexobj(weights):
+            return np.bincount(k, weights.real, len(self)) + 1j * np.bincount(
+                k, weights.imag, len(self)
+            )
+        return np.bincount(k, weights, len(self))
+
+    def evaluate(self, coefficients: np.ndarray, x: np.ndarray) -> np.ndarray:
+        """Evaluate the TPSAs of the columns of the dense coefficients at each row of x.
+
+        The monomials are computed from the monomials of the previous degree, for chunks of
+        points at a time, and only up to the last non-zero coefficient.
+        """
+        x = np.asarray(x)
+        if x.ndim != 2 or x.shape[1] != self.nv:
+            raise ValueError(f"The points must have {self.nv} coordinates, not shape {x.shape}")
+        nonzero = np.flatnonzero(np.any(coefficients != 0, axis=1))
+        nterm = nonzero[-1] + 1 if len(nonzero) else 1
+        out = np.empty((len(x), coefficients.shape[1]), np.result_type(coefficients, x, float))
+        for start in range(0, len(x), EVAL_CHUNK_SIZE):
+            xs = x[start : start + EVAL_CHUNK_SIZE].T
+            terms = np.empty((nterm, xs.shape[1]), out.dtype)
+            terms[0] = 1
+            for k in range(1, nterm):
+                np.multiply(terms[self.parents[k]], xs[self.variables[k]], out=terms[k])
+            out[start : start + EVAL_CHUNK_SIZE] = (coefficients[:nterm].T @ terms).T
+        return out
+
+
+@functools.cache
+def descriptor(nv: int, order: int) -> Descriptor:
+    """Return the (cached) descriptor of the TPSAs in nv variables up to an order."""
+    if nv < 1 or order < 0:
+        raise ValueError("A descriptor requires at least one variable and a non-negative order")
+    return Descriptor(nv, order)
+
+
+def _dense(monos: np.ndarray, coefficients: np.ndarray, order: int | None) -> tuple:
+    """Convert monomials and their coefficients (one column per TPSA) to dense coefficients."""
+    monos = np.asarray(monos, dtype=np.uint8)
+    coefficients = np.asarray(coefficients)
+    if monos.ndim != 2 or len(monos) != len(coefficients):
+        raise ValueError("There must be one row of exponents per coefficient")
+    if order is None:
+        order = int(monos.sum(axis=1).max()) if len(monos) else 0
+    desc = descriptor(monos.shape[1], order)
+    rows = desc.index(monos)
+    keep = rows >= 0  # The monomials above the order are truncated
+    dense = np.zeros((len(desc), *coefficients.shape[1:]), np.result_type(coefficients, float))
+    dense[rows[keep]] = coefficients[keep]
+    return dense, desc
+
+
+class TPSA:
+    """A truncated power series, with the coefficients of every monomial of its descriptor.
+
+    Create one from the monomials and coefficients received from MAD-NG with
+    ``TPSA.from_monomials(*mad.recv())``, and send it back with
+    ``mad.send_tpsa(*tpsa.to_monomials())``.
+
+    Attributes:
+        coefficients (np.ndarray): The coefficient of every monomial of the descriptor.
+        descriptor (Descriptor): The variables, order and monomials of the series.
+    """
+
+    def __init__(self, coefficients: np.ndarray, nv: int, order: int):
+        self.descriptor = descriptor(nv, order)
+        self.coefficients = np.asarray(coefficients)
+        if not np.iscomplexobj(self.coefficients):
+            self.coefficients = self.coefficients.astype(np.float64)
+        if self.coefficients.shape != (len(self.descriptor),):
+            raise ValueError(
+                f"Expected {len(self.descriptor)} coefficients for {nv} variables up to order "
+                f"{order}, got shape {self.coefficients.shape}"
+            )
+
+    @classmethod
+    def from_monomials(
+        cls, monos: np.ndarray, coefficients: np.ndarray, order: int | None = None
+    ) -> TPSA:
+        """Create a TPSA from monomials and their coefficients, e.g. as received from MAD-NG.
+
+        Args:
+            monos (np.ndarray): The exponents of each monomial, one row per monomial.
+            coefficients (np.ndarray): The coefficient of each monomial.
+            order (int, optional): The order to truncate to. Defaults to the highest degree of the monomials.
+        """
+        dense, desc = _dense(monos, coefficients, order)
+        return cls(dense, desc.nv, desc.order)
+
+    def to_monomials(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the monomials with a non-zero coefficient and their coefficients."""
+        rows = np.flatnonzero(self.coefficients)
+        return self.descriptor.monos[rows], self.coefficients[rows]
+
+    @property
+    def nv(self) -> int:
+        return self.descriptor.nv
+
+    @property
+    def order(self) -> int:
+        return self.descriptor.order
+
+    def __getitem__(self, mono: str | Sequence[int]) -> complex | float:
+        """Return the coefficient of a monomial, given as its exponents (e.g. ``"110"``)."""
+        exponents = [int(e) for e in mono]
+        if len(exponents) != self.nv:
+            raise KeyError(mono)
+        row = self.descriptor.index(exponents)[0]
+        return self.coefficients[row] if row >= 0 else 0.0
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        """Evaluate the series at one point (nv values) or at each row of an (N, nv) array."""
+        x = np.asarray(x)
+        res = self.descriptor.evaluate(self.coefficients[:, None], np.atleast_2d(x))[:, 0]
+        return res[0] if x.ndim == 1 else res
+
+    def truncate(self, order: int) -> TPSA:
+        """Return the series truncated to a lower order (or extended with zeros to a higher one)."""
+        return TPSA(_resize(self.coefficients, self.nv, order), self.nv, order)
+
+    def _coefficients_of(self, other: TPSA | complex) -> np.ndarray:
+        if isinstance(other, TPSA):
+            if (other.nv, other.order) != (self.nv, self.order):
+                raise ValueError("The series must have the same variables and order")
+            return other.coefficients
+        coefficients = np.zeros(len(self.descriptor), np.result_type(self.coefficients, other))
+        coefficients[0] = other
+        return coefficients
+
+    def __add__(self, other: TPSA | complex) -> TPSA:
+        return TPSA(self.coefficients + self._coefficients_of(other), self.nv, self.order)
+
+    __radd__ = __add__
+
+    def __sub__(self, other: TPSA | complex) -> TPSA:
+        return TPSA(self.coefficients - self._coefficients_of(other), self.nv, self.order)
+
+    def __rsub__(self, other: complex) -> TPSA:
+        return TPSA(self._coefficients_of(other) - self.coefficients, self.nv, self.order)
+
+    def __neg__(self) -> TPSA:
+        return TPSA(-self.coefficients, self.nv, self.order)
+
+    def __mul__(self, other: TPSA | complex) -> TPSA:
+        if not isinstance(other, TPSA):
+            return TPSA(self.coefficients * other, self.nv, self.order)
+        coefficients = self.descriptor.multiply(self.coefficients, self._coefficients_of(other))
+        return TPSA(coefficients, self.nv, self.order)
+
+    __rmul__ = __mul__
+
+    def __repr__(self) -> str:
+        nonzero = np.count_nonzero(self.coefficients)
+        return f"TPSA(nv={self.nv}, order={self.order}, nonzero={nonzero})"
+
+
+def _resize(coefficients: np.ndarray, nv: int, order: int) -> np.ndarray:
+    """Truncate (or extend with zeros) dense coefficients of nv variables to an order."""
+    ncoef = len(descriptor(nv, order))
+    if ncoef <= len(coefficients):
+        return coefficients[:ncoef].copy()
+    resized = np.zeros((ncoef, *coefficients.shape[1:]), coefficients.dtype)
+    resized[: len(coefficients)] = coefficients
+    return resized
+
+
+class DAMap:
+    """A map of truncated power series (e.g. the six components of a one-turn map).
+
+    The series share their descriptor, so the coefficients are stored as one matrix, with
+    one row per monomial and one column per component, and evaluating the map computes the
+    monomials only once for all the components.
+
+    Attributes:
+        coefficients (np.ndarray): The (ncoef, ncomponent) coefficients, in the order of the descriptor.
+        descriptor (Descriptor): The variables, order and monomials of the series.
+    """
+
+    def __init__(self, coefficients: np.ndarray, nv: int, order: int):
+        self.descriptor = descriptor(nv, order)
+        self.coefficients = np.asarray(coefficients)
+        if not np.iscomplexobj(self.coefficients):
+            self.coefficients = self.coefficients.astype(np.float64)
+        if self.coefficients.ndim != 2 or len(self.coefficients) != len(self.descriptor):
+            raise ValueError(
+                f"Expected {len(self.descriptor)} rows of coefficients for {nv} variables up to "
+                f"order {order}, got shape {self.coefficients.shape}"
+            )
+
+    @classmethod
+    def from_tpsas(cls, *tpsas: TPSA) -> DAMap:
+        """Create a map from its components, extended to the highest order of the components."""
+        if not tpsas or len({tpsa.nv for tpsa in tpsas}) != 1:
+            raise ValueError("A map requires at least one series, all with the same variables")
+        nv, order = tpsas[0].nv, max(tpsa.order for tpsa in tpsas)
+        columns = [_resize(tpsa.coefficients, nv, order) for tpsa in tpsas]
+        return cls(np.column_stack(columns), nv, order)
+
+    @classmethod
+    def from_monomials(
+        cls, monos: np.ndarray, coefficients: np.ndarray, order: int | None = None
+    ) -> DAMap:
+        """Create a map from monomials and the coefficients of each component (one column each).
+
+        Args:
+            monos (np.ndarray): The exponents of each monomial, one row per monomial.
+            coefficients (np.ndarray): The coefficients of each monomial, one column per component.
+            order (int, optional): The order to truncate to. Defaults to the highest degree of the monomials.
+        """
+        dense, desc = _dense(monos, np.asarray(coefficients).reshape(len(monos), -1), order)
+        return cls(dense, desc.nv, desc.order)
+
+    def to_monomials(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the monomials with a non-zero coefficient in any component, and the coefficients."""
+        rows = np.flatnonzero(np.any(self.coefficients != 0, axis=1))
+        return self.descriptor.monos[rows], self.coefficients[rows]
+
+    @property
+    def nv(self) -> int:
+        return self.descriptor.nv
+
+    @property
+    def order(self) -> int:
+        return self.descriptor.order
+
+    def __len__(self) -> int:
+        return self.coefficients.shape[1]
+
+    def __getitem__(self, i: int) -> TPSA:
+        return TPSA(self.coefficients[:, i].copy(), self.nv, self.order)
+
+    def __iter__(self) -> Iterator[TPSA]:
+        return (self[i] for i in range(len(self)))
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        """Evaluate the map at one point (nv values) or at each row of an (N, nv) array.
+
+        Returns:
+            np.ndarray: The value of each component, one row per point.
+        """
+        x = np.asarray(x)
+        res = self.descriptor.evaluate(self.coefficients, np.atleast_2d(x))
+        return res[0] if x.ndim == 1 else res
+
+    def truncate(self, order: int) -> DAMap:
+        """Return the map truncated to a lower order (or extended with zeros to a higher one)."""
+        return DAMap(_resize(self.coefficients, self.nv, order), self.nv, order)
+
+    def compose(self, other: DAMap) -> DAMap:
+        """Return the map ``self(other(x))``, truncated to the lowest order of the two maps.
+
+        The components of other are the variables of self, so other must have nv components.
+        """
+        if len(other) != self.nv:
+            raise ValueError(f"The inner map must have {self.nv} components, not {len(other)}")
+        order = min(self.order, other.order)
+        inner = other.truncate(order)
+        desc = inner.descriptor
+        # Each monomial of self is the product of a monomial of the previous degree and a variable
+        terms = np.zeros((len(self.descriptor), len(desc)), np.result_type(inner.coefficients))
+        terms[0, 0] = 1
+        for k in range(1, len(self.descriptor)):
+            parent, var = self.descriptor.parents[k], self.descriptor.variables[k]
+            terms[k] = desc.multiply(terms[parent], inner.coefficients[:, var])
+        return DAMap(terms.T @ self.coefficients, desc.nv, order)
+
+    def __repr__(self) -> str:
+        return f"DAMap(nv={self.nv}, order={self.order}, components={len(self)})"
@@ -3,7 +3,7 @@ from pathlib import Path
 
 import numpy as np
 
-from pymadng import MAD
+from pymadng import MAD, TPSA, DAMap
 
 inputs_folder = Path(__file__).parent / "inputs"
 # TODO: Test the following functions:
@@ -234,6 +234,109 @@ class TestTPSA(unittest.TestCase):
             self.assertTrue((init[0] == final[0]).all())
             self.assertTrue((init[1] == final[1]).all())
 
+    def test_send_recv_damap_packed(self):
+        with MAD() as mad:
+            mad.send("""
+            local sin in MAD.gmath
+            MAD.gtpsad(6, 3)
+            M = MAD.damap {xy = 3}
+            M[1] = 1 ; M[3] = 2
+            M[2] = sin(M[1]) * M[3]
+            """)
+            damap = mad.recv_damap("M")
+            self.assertEqual((len(damap), damap.nv, damap.order), (6, 6, 3))
+            self.assertIsNotNone(damap.descriptor.mad_rows)  # Received with the first map
+            self.assertAlmostEqual(damap[1]["101000"], np.cos(1))  # sin(1 + x1) * (2 + x3)
+            self.assertAlmostEqual(damap[1]["200000"], -np.sin(1))
+            mad.send("py:send(M[2])")
+            component = TPSA.from_monomials(*mad.recv(), order=3)
+            np.testing.assert_allclose(damap[1].coefficients, component.coefficients)
+
+            mad.send_damap("M2", damap)
+            mad.send("py:send(M2[2])")
+            component = TPSA.from_monomials(*mad.recv(), order=3)
+            np.testing.assert_allclose(damap[1].coefficients, component.coefficients)
+            np.testing.assert_allclose(mad.recv_damap("M2").coefficients, damap.coefficients)
+
+    def test_send_recv_damap_dense(self):
+        with MAD() as mad:
+            mad.send("""
+            local sin in MAD.gmath
+            MAD.gtpsad(6, 4)
+            M = MAD.damap {xy = 4}
+            M[1] = 1 ; M[3] = 2
+            M[2] = sin(M[1]) * sin(M[3])
+            M[4] = M[1] * M[3] * M[5] + M[2] * M[6]
+            """)
+            sparse, dense = mad.recv_damap("M"), mad.recv_damap("M", dense=True)
+            np.testing.assert_allclose(dense.coefficients, sparse.coefficients)
+            component = mad.recv_tpsa("M[2]", dense=True)
+            np.testing.assert_allclose(component.coefficients, sparse[1].coefficients)
+            self.assertAlmostEqual(component["000000"], np.sin(1) * np.sin(2))
+            self.assertAlmostEqual(component["101000"], np.cos(1) * np.cos(2))
+            self.assertAlmostEqual(dense[3]["101010"], 1)  # (1 + x1) * (2 + x3) * x5
+            self.assertAlmostEqual(dense[3]["001010"], 1)
+            mad.send("py:send(M[4])")
+            component = TPSA.from_monomials(*mad.recv(), order=4)
+            np.testing.assert_allclose(dense[3].coefficients, component.coefficients)
+
+            mad.send_damap("M2", dense, dense=True)
+            np.testing.assert_allclose(mad.recv_damap("M2").coefficients, dense.coefficients)
+            mad.send("py:send(M2[4])")
+            component = TPSA.from_monomials(*mad.recv(), order=4)
+            np.testing.assert_allclose(dense[3].coefficients, component.coefficients)
+
+    def test_tpsa_evaluation(self):
+        with MAD() as mad:
+            mad.send("""
+            local sin in MAD.gmath
+            MAD.gtpsad(6, 5)
+            local M = MAD.damap {xy = 5}
+            M[1] = 1 ; M[3] = 2
+            py:send(sin(M[1]) * sin(M[3]))
+            """)
+            res = TPSA.from_monomials(*mad.recv())
+            self.assertEqual((res.nv, res.order), (6, 5))
+            self.assertAlmostEqual(res["000000"], np.sin(1) * np.sin(2))
+            self.assertAlmostEqual(res[(1, 0, 1, 0, 0, 0)], np.cos(1) * np.cos(2))
+            x = np.zeros((10, 6))
+            x[:, 0], x[:, 2] = np.linspace(-1e-2, 1e-2, 10), 5e-3
+            np.testing.assert_allclose(res(x), np.sin(1 + x[:, 0]) * np.sin(2 + x[:, 2]))
+
+    def test_tpsa_monomials(self):
+        with MAD() as mad:
+            mad.send("""
+            MAD.gtpsad(6, 2)
+            local M = MAD.damap {xy = 2}
+            py:send(M[1] * M[3] + 2 * M[2] * M[2] + 3 * M[1] * M[5] + 4 * M[4])
+            """)
+            monos, coefficients = mad.recv()
+            res = TPSA.from_monomials(monos, coefficients, order=2)
+            rows = res.descriptor.index(monos)  # Each monomial of MAD-NG is found once
+            self.assertTrue((rows >= 0).all())
+            self.assertEqual(len(set(rows.tolist())), len(monos))
+            self.assertEqual(res["101000"], 1)
+            self.assertEqual(res["020000"], 2)
+            self.assertEqual(res["100010"], 3)
+            self.assertEqual(res["000100"], 4)
+            self.assertEqual(res["110000"], 0)
+            x = np.random.default_rng(0).uniform(-1, 1, (10, 6))
+            expected = x[:, 0] * x[:, 2] + 2 * x[:, 1] ** 2 + 3 * x[:, 0] * x[:, 4] + 4 * x[:, 3]
+            np.testing.assert_allclose(res(x), expected)
+            np.testing.assert_equal(res.to_monomials()[1], [4, 1, 3, 2])
+
+    def test_damap_composition(self):
+        x, y = (TPSA(np.eye(6)[i], 2, 2) for i in (1, 2))  # The variables, up to order 2
+        inner = DAMap.from_tpsas(x + 2 * y, x * y + 0.5)
+        outer = DAMap.from_tpsas(x * x - y, 3 * y + x * y)
+        points = np.random.default_rng(0).uniform(-1, 1, (20, 2))
+        composed = outer.compose(inner)
+        self.assertEqual(len(composed), 2)
+        # Only the terms of order 3, x*x*y + 2*x*y*y in the second component, are truncated
+        x0, x1 = points.T
+        truncated = np.column_stack([np.zeros(20), x0 * x0 * x1 + 2 * x0 * x1 * x1])
+        np.testing.assert_allclose(outer(inner(points)) - composed(points), truncated, atol=1e-12)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,3 +1,4 @@
+import importlib.util
 import math
 import sys
 import unittest
@@ -143,6 +144,42 @@ class TestObjFun(unittest.TestCase):
             qd = mad.quadrupole(knl=[0, 0.25], l=1)
             self.assertEqual(qd._name, "_last[1]")
 
+    def test_temporaries_grow_and_clear(self):
+        with MAD(num_temp_vars=2) as mad:
+            results = [mad.math.sqrt(i) for i in range(20)]  # More than num_temp_vars
+            self.assertEqual(results[-1]._name, "_last[20]")
+            self.assertEqual([res.eval() for res in results], [math.sqrt(i) for i in range(20)])
+
+            del results  # The temporaries are cleared in MAD-NG with the next command
+            mad.protected_send("py:send(next(_last) == nil)")
+            self.assertTrue(mad.recv())
+            self.assertEqual(mad.math.sqrt(4)._name, "_last[1]")
+
+    def test_own(self):
+        with MAD(gc_step_on_release=True) as mad:
+            mad.send("tbl = {1, 2, 3}; num = 4")
+            tbl, num = mad.own("tbl", "num")
+            self.assertEqual(tbl.eval(), [1, 2, 3])
+            self.assertEqual(num, 4)
+            del tbl  # The variable is released in MAD-NG with the next command
+            self.assertIsNone(mad.tbl)
+            self.assertEqual(mad.num, 4)
+
+            mad.send("tbl = {1}")
+            tbl1 = mad.own("tbl")
+            mad.send("tbl = {2}")
+            tbl2 = mad.own("tbl")  # The new owner replaces the previous one
+            del tbl1
+            self.assertEqual(mad.tbl.eval(), [2])
+            del tbl2
+            self.assertIsNone(mad.tbl)
+
+            mad.send("tbl = {3}")
+            tbl3 = mad.own("tbl")
+            mad.send("tbl = {4}")  # Reassigned without taking ownership
+            del tbl3
+            self.assertEqual(mad.tbl.eval(), [4])  # The new value is not released
+
     def test_call_last(self):
         with MAD() as mad:
             mad.send("func_test = \\a-> \\b-> \\c-> a+b*c")
@@ -308,6 +345,16 @@ class TestArgsAndKwargs(unittest.TestCase):
             self.assertEqual(sd.opposite, False)
             self.assertTrue(np.all(sd.mat == np.arange(9).reshape((3, 3)) + 1))
 
+    def test_large_args(self):
+        with MAD() as mad:
+            mad.load("element", "sextupole")
+            knl = [0.1 * i for i in range(1000)]  # Sent as a vector
+            ksl = [1e-300, -2.5, 1 / 3, np.float64(0.7), np.int32(4)]  # Written as literals
+            sd = mad.sextupole(knl=knl, ksl=ksl, knobs=[{"k": i / 7} for i in range(100)])
+            self.assertEqual(sd.knl.eval(), knl)
+            self.assertEqual(sd.ksl.eval(), ksl)
+            self.assertEqual(sd.knobs[99].k, 99 / 7)
+
 
 class TestDir(unittest.TestCase):
     def test_dir(self):
@@ -346,6 +393,58 @@ class TestDir(unittest.TestCase):
             self.assertGreater(len(expected_dir), 0)
             self.assertEqual(dir(mad.last), expected_dir)
 
+    def test_dir_cache(self):
+        with MAD() as mad:
+            mad.load("MAD", "object")
+            mad.send("my_obj = object {a = 1}")
+            self.assertIn("a", dir(mad.my_obj))
+            self.assertIn("my_obj", dir(mad))
+
+            # Listing the keys of other tables keeps the cached keys
+            cache = mad._MAD__process.dir_cache
+            mad.send("other_obj = object {}")
+            dir(mad.my_obj)
+            dir(mad.other_obj)
+            self.assertIn(mad.my_obj._name, cache)
+            self.assertIn(mad.other_obj._name, cache)
+
+            # Assignments from Python invalidate the cached keys
+            mad.my_obj.b = 2
+            self.assertIn("b", dir(mad.my_obj))
+            mad.object.c = 3  # Inherited by my_obj
+            self.assertIn("c", dir(mad.my_obj))
+            mad["new_var"] = 4
+            self.assertIn("new_var", mad.globals())
+
+            # As do commands sent to MAD-NG
+            mad.send("my_obj.d = 5; other_var = 6")
+            self.assertIn("d", dir(mad.my_obj))
+            self.assertIn("other_var", dir(mad))
+
+    def test_value_cache(self):
+        with MAD() as mad:
+            mad.send("a = 1; obj = {x = 2}")
+            with mad.cached():
+                self.assertEqual(mad.a, 1)
+                self.assertEqual(mad.obj.x, 2)
+                self.assertEqual(mad._MAD__process.value_cache, {"a": 1, "obj['x']": 2})
+                mad.send("n = 7; t = true")  # Received as numpy scalars
+                self.assertEqual(mad.n, 7)
+                self.assertEqual(mad.t, True)
+                self.assertIn("n", mad._MAD__process.value_cache)
+                self.assertIn("t", mad._MAD__process.value_cache)
+
+                # Assignments from Python invalidate the cached values
+                mad["a"] = 3
+                self.assertEqual(mad.a, 3)
+                mad.obj.x = 4
+                self.assertEqual(mad.obj.x, 4)
+
+                # As do commands sent to MAD-NG
+                mad.send("a = 5")
+                self.assertEqual(mad.a, 5)
+            self.assertIsNone(mad._MAD__process.value_cache)
+
     def test_history(self):
         with MAD(debug=True, stdout="/dev/null") as mad:
             mad.send("a = 1")
@@ -442,6 +541,303 @@ test = mtable{"string", "number"} + {"a", 1.1} + {"b", 2.2}
             self.assertEqual(df["number"].tolist(), [1.1, 2.2])
 
 
+class TestRowSelection(unittest.TestCase):
+    def test_row_selection(self):
+        with MAD() as mad:
+            mad.send("""
+test = mtable{
+    "name", "kind", "s", "list",
+    header = {"q1", "knobs"}, q1 = 0.25, knobs = {1, 2},
+}
+    + {"bpm.1", "monitor"   , 0.0, {1}}
+    + {"mq.1" , "quadrupole", 1.0, {2}}
+    + {"bpm.2", "monitor"   , 2.0, {3}}
+    + {"mq.2" , "quadrupole", 3.0, {4}}
+               """)
+            df = mad.test.to_df(force_pandas=True, pattern="^bpm")
+            self.assertEqual(df["name"].tolist(), ["bpm.1", "bpm.2"])
+            self.assertEqual(df["s"].tolist(), [0.0, 2.0])
+            self.assertEqual([lst.eval() for lst in df["list"]], [[1], [3]])
+            self.assertEqual(df.attrs["q1"], 0.25)
+            self.assertEqual(df.attrs["knobs"], [1, 2])
+
+            df = mad.test.to_df(force_pandas=True, kind=["quadrupole"], rows=slice(2, None))
+            self.assertEqual(df["name"].tolist(), ["mq.2"])
+            self.assertEqual(df["s"].tolist(), [3.0])
+
+            df = mad.test.to_df(force_pandas=True, kind="drift")
+            self.assertEqual(len(df), 0)
+
+            cols = mad.test.fetch_columns(["s"], rows=[0, 1], kind="monitor")
+            self.assertEqual(cols["s"].tolist(), [0.0])
+
+
+class TestAggregate(unittest.TestCase):
+    def test_aggregate(self):
+        with MAD() as mad:
+            mad.send("""
+test = mtable{"name", "kind", "x", "beta11"}
+    + {"bpm.1", "monitor"   , 1.0, 10.0}
+    + {"mq.1" , "quadrupole", -3.0, 20.0}
+    + {"bpm.2", "monitor"   , 2.0, 30.0}
+    + {"mq.2" , "quadrupole", 4.0, 40.0}
+               """)
+            x, beta11 = np.array([1.0, -3.0, 2.0, 4.0]), np.array([10.0, 20.0, 30.0, 40.0])
+            res = mad.test.aggregate({"beta11": ["max", "rms"], "x": ["mean", "std", "absmax"]})
+            self.assertEqual(list(res), ["beta11", "x"])
+            self.assertEqual(res["beta11"]["max"], 40.0)
+            self.assertAlmostEqual(res["beta11"]["rms"], np.sqrt(np.mean(beta11**2)))
+            self.assertAlmostEqual(res["x"]["mean"], np.mean(x))
+            self.assertAlmostEqual(res["x"]["std"], np.std(x))
+            self.assertEqual(res["x"]["absmax"], 4.0)
+
+            res = mad.test.aggregate(
+                {"x": "sum", "beta11": ["count", "min"]}, where={"kind": "monitor"}
+            )
+            self.assertEqual(res, {"x": {"sum": 3.0}, "beta11": {"count": 2, "min": 10.0}})
+
+            res = mad.test.aggregate({"x": ["count", "mean"]}, where={"pattern": "^none"})
+            self.assertEqual(res["x"]["count"], 0)
+            self.assertTrue(np.isnan(res["x"]["mean"]))
+
+            self.assertRaises(ValueError, lambda: mad.test.aggregate({"x": "median"}))
+            self.assertRaises(
+                RuntimeError, lambda: mad.test.aggregate({"x": "sum"}, where={"rows": [4]})
+            )
+            # The process is still usable after the error
+            self.assertEqual(
+                mad.test.aggregate({"x": "sum"}, where={"rows": [3]}), {"x": {"sum": 4.0}}
+            )
+
+
+class TestSync(unittest.TestCase):
+    def test_sync(self):
+        with MAD() as mad:
+            mad.send('test = mtable{"name", "x"}')
+            tbl = mad.test
+            cols = tbl.sync()
+            self.assertEqual(list(cols), ["name", "x"])
+            self.assertEqual(len(cols["x"]), 0)
+
+            mad.send('test = test + {"a", 1.0} + {"b", 2.0}')
+            cols = tbl.sync()
+            self.assertEqual(cols["name"].tolist(), ["a", "b"])
+            self.assertEqual(cols["x"].tolist(), [1.0, 2.0])
+
+            for i in range(3, 40):
+                mad.send(f'test = test + {{"e{i}", {i}.0}}')
+                cols = tbl.sync()
+            self.assertEqual(cols["x"].tolist(), [float(i) for i in range(1, 40)])
+            self.assertEqual(cols["name"][-1], "e39")
+
+            # The rows received are kept by name, not by reference
+            mad.send('test = test + {"e40", 40.0}')
+            cols = mad.test.sync()
+            self.assertEqual(len(cols["x"]), 40)
+            self.assertEqual(cols["x"][0], 1.0)
+            self.assertEqual(len(mad.test.sync()["x"]), 40)
+
+            cols = tbl.sync(["x"])  # Changing the columns restarts from the first row
+            self.assertEqual(list(cols), ["x"])
+            self.assertEqual(len(cols["x"]), 40)
+
+
+class TestFetchColumns(unittest.TestCase):
+    def test_fetch_columns(self):
+        with MAD() as mad:
+            mad.send("""
+test = mtable{"name", "s", "beta11"}
+    + {"a", 0.0, 1.5} + {"b", 1.0, 2.5} + {"c", 2.0, 3.5} + {"d", 3.0, 4.5}
+               """)
+            cols = mad.test.fetch_columns(["beta11", "name", "s"])
+            self.assertEqual(list(cols), ["beta11", "name", "s"])
+            self.assertEqual(cols["s"].shape, (4,))
+            self.assertEqual(cols["s"].tolist(), [0.0, 1.0, 2.0, 3.0])
+            self.assertEqual(cols["beta11"].tolist(), [1.5, 2.5, 3.5, 4.5])
+            self.assertEqual(cols["name"].tolist(), ["a", "b", "c", "d"])
+
+            cols = mad.test.fetch_columns()
+            self.assertEqual(list(cols), ["name", "s", "beta11"])
+
+            cols = mad.test.fetch_columns(["name", "s"], rows=slice(1, None, 2))
+            self.assertEqual(cols["name"].tolist(), ["b", "d"])
+            self.assertEqual(cols["s"].tolist(), [1.0, 3.0])
+
+            cols = mad.test.fetch_columns(["s"], rows=slice(None, None, -1))
+            self.assertEqual(cols["s"].tolist(), [3.0, 2.0, 1.0, 0.0])
+
+            cols = mad.test.fetch_columns(["name", "s"], rows=[-1, 0])
+            self.assertEqual(cols["name"].tolist(), ["d", "a"])
+            self.assertEqual(cols["s"].tolist(), [3.0, 0.0])
+
+            cols = mad.test.fetch_columns(["s"], rows=np.array([True, False, False, True]))
+            self.assertEqual(cols["s"].tolist(), [0.0, 3.0])
+
+            cols = mad.test.fetch_columns(["name", "s"], rows=[])
+            self.assertEqual(cols["name"].shape, (0,))
+            self.assertEqual(cols["s"].shape, (0,))
+
+            self.assertRaises(RuntimeError, lambda: mad.test.fetch_columns(["s"], rows=[4]))
+            self.assertRaises(RuntimeError, lambda: mad.test.fetch_columns(["s"], rows=[-5]))
+            # The process is still usable after the errors
+            cols = mad.test.fetch_columns(["s"], rows=[3])
+            self.assertEqual(cols["s"].tolist(), [3.0])
+            mad.send("py:send(42)")
+            self.assertEqual(mad.recv(), 42)
+
+    def test_structured_array(self):
+        with MAD() as mad:
+            mad.send("""
+test = mtable{"name", "s", "beta11"} + {"a", 0.0, 1.5} + {"b\\195\\169", 1.0, 2.5} + {"c\\nd", 2.0, 3.5}
+               """)
+            arr = mad.test.convert_to_structured_array()
+            self.assertEqual(arr.dtype.names, ("name", "s", "beta11"))
+            self.assertEqual(arr["name"].tolist(), ["a", "bé", "c\nd"])
+            self.assertEqual(arr["s"].tolist(), [0.0, 1.0, 2.0])
+            self.assertEqual(arr["beta11"].tolist(), [1.5, 2.5, 3.5])
+
+            arr = mad.test.convert_to_structured_array(["beta11", "s"], rows=slice(1, None))
+            self.assertEqual(arr.dtype.names, ("beta11", "s"))
+            self.assertEqual(arr.tolist(), [(2.5, 1.0), (3.5, 2.0)])
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "pyarrow is not installed")
+    def test_record_batch(self):
+        import pyarrow as pa
+
+        with MAD() as mad:
+            mad.send("""
+test = mtable{"name", "s", "beta11"} + {"a", 0.0, 1.5} + {"b\\195\\169", 1.0, 2.5} + {"c\\nd", 2.0, 3.5}
+               """)
+            batch = mad.test.convert_to_record_batch()
+            self.assertTrue(isinstance(batch, pa.RecordBatch))
+            self.assertEqual(batch.schema.names, ["name", "s", "beta11"])
+            self.assertEqual(batch.column("name").to_pylist(), ["a", "bé", "c\nd"])
+            self.assertEqual(batch.column("s").to_pylist(), [0.0, 1.0, 2.0])
+            df = batch.to_pandas()
+            self.assertEqual(df["beta11"].tolist(), [1.5, 2.5, 3.5])
+
+
+class TestSequenceExport(unittest.TestCase):
+    def test_export(self):
+        with MAD() as mad:
+            mad.send("""
+            local quadrupole, sextupole in MAD.element
+            seq = sequence "seq" { l = 10, refer = "entry",
+              quadrupole "qf" {at = 1, l = 1, k1 = 0.5, knob = 3, label = "a"},
+              sextupole "sd" {at = 4, l = 2},
+              quadrupole "qd" {at = 8, l = 1, k1 = -0.5},
+            }
+            """)
+            res = mad.seq.export(["name", "kind", "l", "knob", "label"])
+            self.assertEqual(list(res), ["s", "name", "kind", "l", "knob", "label"])
+            self.assertEqual(res["name"].tolist(), ["$start", "qf", "sd", "qd", "$end"])
+            self.assertEqual(res["kind"][1:4].tolist(), ["quadrupole", "sextupole", "quadrupole"])
+            self.assertEqual(res["s"].tolist(), [0, 1, 4, 8, 10])
+            self.assertEqual(res["l"].tolist(), [0, 1, 2, 1, 0])
+            np.testing.assert_equal(res["knob"], [np.nan, 3, np.nan, np.nan, np.nan])
+            self.assertEqual(res["label"].tolist(), ["", "a", "", "", ""])
+
+            res = mad.seq.export(["k1"], at="centre_s", refer="centre")
+            self.assertEqual(list(res), ["centre_s", "k1"])
+            self.assertEqual(res["centre_s"][1:4].tolist(), [1.5, 5, 8.5])
+            self.assertEqual(res["k1"][[1, 3]].tolist(), [0.5, -0.5])
+            self.assertRaises(ValueError, lambda: mad.seq.export(refer="middle"))
+
+    def test_update(self):
+        with MAD() as mad:
+            mad.send("""
+            local quadrupole in MAD.element
+            kq = 0.1
+            seq = sequence "seq" { l = 10,
+              quadrupole "qf" {at = 1, l = 1},
+              quadrupole "qd" {at = 4, l = 1, k1 := kq},
+              quadrupole "qf" {at = 7, l = 1},
+            }
+            """)
+            mad.seq.update(["qf", "qd"], {"k1": np.array([0.5, -0.5]), "tilt": 0.25})
+            res = mad.seq.export(["k1", "tilt"], at=None)
+            self.assertEqual(res["k1"][1:4].tolist(), [0.5, -0.5, 0.5])
+            self.assertEqual(res["tilt"][1:4].tolist(), [0.25, 0.25, 0.25])
+
+            mad.seq.update([1, -2], {"k1": [1, 2]})  # 0-based indices, including $start
+            self.assertEqual(mad.seq.export(["k1"], at=None)["k1"][1:4].tolist(), [1, -0.5, 2])
+
+            # Deferred expressions can be kept
+            mad.send("seq.qd.k1 = function () return kq end")
+            mad.seq.update("qd", {"k1": 3}, keep_deferred=True)
+            mad["kq"] = 0.2
+            self.assertEqual(mad.seq.qd.k1, 0.2)
+            mad.seq.update("qd", {"k1": 3})
+            self.assertEqual(mad.seq.qd.k1, 3)
+
+    def test_build_sequence(self):
+        with MAD() as mad:
+            df = pd.DataFrame(
+                {
+                    "name": ["qf", "sd", "qd"],
+                    "kind": ["quadrupole", "sextupole", "quadrupole"],
+                    "at": [1.0, 4.0, 8.0],
+                    "l": [1, 2, 1],
+                    "k1": [0.5, np.nan, -0.5],
+                    "label": ["a", "", "c"],
+                }
+            )
+            seq = mad.build_sequence("seq", df, l=10, refer="'entry'")
+            self.assertEqual(seq.l, 10)
+            res = seq.export(["name", "kind", "l", "k1", "label"])
+            self.assertEqual(res["name"][1:4].tolist(), ["qf", "sd", "qd"])
+            self.assertEqual(res["kind"][1:4].tolist(), df["kind"].tolist())
+            self.assertEqual(res["s"][1:4].tolist(), [1, 4, 8])
+            self.assertEqual(res["l"][1:4].tolist(), [1, 2, 1])
+            self.assertEqual(res["k1"][[1, 3]].tolist(), [0.5, -0.5])
+            self.assertEqual(res["label"][1:4].tolist(), ["a", "", "c"])
+
+            # Structured arrays work too
+            arr = np.zeros(2, dtype=[("name", "U2"), ("kind", "U6"), ("at", "f8")])
+            arr["name"], arr["kind"], arr["at"] = ["m1", "m2"], "marker", [1, 2]
+            self.assertEqual(
+                mad.build_sequence("seq2", arr).export()["name"][1:3].tolist(), ["m1", "m2"]
+            )
+
+    def test_cached_result(self):
+        with MAD() as mad:
+            mad.send("""
+            kq = 0.1
+            seq = MAD.sequence "seq" { l = 10,
+              MAD.element.quadrupole "qf" {at = 1, l = 1, angle := kq},
+            }
+            """)
+            cols, hdr = mad.cached_result("survey", ["s", "x"], sequence=mad.seq)
+            self.assertEqual(hdr["name"], "seq")
+            self.assertFalse(cols["x"].flags.writeable)
+            self.assertEqual(len(mad.result_cache), 1)
+
+            # The same lattice hits the cache, a change of a deferred expression does not
+            self.assertIs(mad.cached_result("survey", ["s", "x"], sequence=mad.seq)[0], cols)
+            mad["kq"] = 0.2
+            cols2, _ = mad.cached_result("survey", ["s", "x"], sequence=mad.seq)
+            self.assertNotEqual(cols2["x"][-1], cols["x"][-1])
+            self.assertEqual(len(mad.result_cache), 2)
+
+            # The arguments given as code are fingerprinted by value too
+            self.assertIs(mad.cached_result("survey", ["s", "x"], sequence="seq")[0], cols2)
+            mad["kq"] = 0.3
+            cols3, _ = mad.cached_result("survey", ["s", "x"], sequence="seq")
+            self.assertNotEqual(cols3["x"][-1], cols2["x"][-1])
+
+            # The random generators are not advanced by the fingerprint, so it is reproducible
+            mad.send("seq.qf.tilt = \\-> MADX.ranf() * 0")
+            cols4, _ = mad.cached_result("survey", ["s", "x"], sequence=mad.seq)
+            self.assertIs(mad.cached_result("survey", ["s", "x"], sequence=mad.seq)[0], cols4)
+
+            self.assertRaises(
+                ValueError,
+                lambda: mad.cached_result(
+                    "survey", sequence=mad.seq, beam=mad.MAD.beam(), state="1"
+                ),
+            )
+
+
 class TestEval(unittest.TestCase):
     def test_eval(self):
         with MAD() as mad:
@@ -463,6 +859,98 @@ class TestEval(unittest.TestCase):
             self.assertTrue(isinstance(result, MadLastRef))
             self.assertEqual(result.eval(), math.sqrt(2) + math.log(10))
 
+    def test_madx_snapshot(self):
+        with MAD() as mad:
+            mad.send("MADX.ka, MADX.kb = 1.5, 2; MADX.kc = function () return MADX.ka * 2 end")
+            snapshot = mad.madx_snapshot()
+            values = dict(zip(*snapshot))
+            self.assertEqual((values["ka"], values["kb"]), (1.5, 2))
+            self.assertNotIn("kc", values)  # Deferred expressions are not captured
+
+            mad.send("MADX.ka = 3; MADX.kb = function () return 4 end; MADX.kd = 5")
+            self.assertEqual(mad.MADX.kc, 6)
+            mad.madx_restore(snapshot)
+            self.assertEqual((mad.MADX.ka, mad.MADX.kb, mad.MADX.kc), (1.5, 2, 3))
+            self.assertEqual(mad.MADX.kd, 5)
+
+            mad.send("MADX.ka = 3")
+            mad.madx_restore(snapshot, only_changed=False)
+            self.assertEqual(mad.MADX.ka, 1.5)
+
+    def test_madx_dependencies(self):
+        with MAD() as mad:
+            mad.send("""
+            local quadrupole in MAD.element
+            MADX.ka, MADX.kb, MADX.kc = 1, 2, 3
+            MADX.kab = function () return MADX.ka + MADX.kb end
+            MADX.q1 = quadrupole "q1" {k1 = function () return MADX.kab * 2 end}
+            MADX.q2 = quadrupole "q2" {k1 = function () return MADX.kb end, l = 1}
+            """)
+            deps = mad.madx_dependencies()
+            self.assertIs(mad.madx_dependencies(), deps)  # Cached
+            self.assertEqual(sorted(deps.affected_expressions("ka")), ["kab", "q1.k1"])
+            self.assertEqual(deps.affected_elements("ka"), ["q1"])
+            self.assertEqual(sorted(deps.affected_elements("kb")), ["q1", "q2"])
+            self.assertEqual(deps.affected_elements("kc"), [])
+            self.assertRaises(KeyError, lambda: deps.affected_elements("kz"))
+
+            mad.send("MADX.q2.k1 = function () return MADX.kc end")
+            self.assertEqual(mad.madx_dependencies(refresh=True).affected_elements("kc"), ["q2"])
+
+            # The random generators are not called while tracing
+            mad.send("""
+            ncall = 0
+            MADX.ranf = function () ncall = ncall + 1 return 0.5 end
+            MADX.kr = function () return MADX.ka * MADX.ranf() end
+            """)
+            deps = mad.madx_dependencies(refresh=True)
+            self.assertEqual(mad.ncall, 0)
+            self.assertNotIn("ranf", deps.expressions)
+            self.assertEqual(sorted(deps.affected_expressions("ka")), ["kab", "kr", "q1.k1"])
+
+            # The builtin functions are not deferred expressions
+            mad.send("MADX.sq = math.sqrt; MADX.q2.fn = math.abs")
+            deps = mad.madx_dependencies(refresh=True)
+            self.assertNotIn("sq", deps.expressions)
+            self.assertNotIn("q2.fn", deps.expressions)
+
+    def test_eval_many(self):
+        with MAD() as mad:
+            mad.send("""
+            a = 2
+            exprs = {
+              function () return a * 2 end, function () return a + 0.5 end, 3,
+              function () return "str" end, function () error("fail") end,
+            }
+            """)
+            np.testing.assert_equal(mad.eval_many("exprs"), [4, 2.5, 3, np.nan, np.nan])
+            mad["a"] = 4
+            np.testing.assert_equal(mad.eval_many(mad.exprs), [8, 4.5, 3, np.nan, np.nan])
+            mad.send("empty = {}")
+            self.assertEqual(mad.eval_many("empty").shape, (0,))
+
+    def test_eval_deferred(self):
+        with MAD() as mad:
+            mad.send("""
+            a = 2
+            knobs = {
+              k1 = function () return a * 10 end, name = "x",
+              sub = {k2 = function () return a / 4 end, ["k.3"] = function () return 1 end},
+              list = {function () return 7 end},
+              ranf = function () ncall = ncall + 1 return 0.5 end, sqrt = math.sqrt,
+            }
+            ncall = 0
+            """)
+            names, values = mad.eval_deferred("knobs")
+            self.assertEqual(mad.ncall, 0)  # The random generators are not called
+            self.assertEqual(
+                dict(zip(names, values)),
+                {"k1": 20, "sub.k2": 0.5, "sub['k.3']": 1, "list[1]": 7},
+            )
+            names, values = mad.eval_deferred(mad.knobs, recursive=False)
+            self.assertEqual(names, ["k1"])
+            self.assertEqual(values.tolist(), [20])
+
 
 class TestIteration(unittest.TestCase):
     def test_iterate_through_object(self):
@@ -479,6 +967,101 @@ class TestIteration(unittest.TestCase):
                 else:
                     self.assertEqual(elem.kind, "marker")
 
+    def test_iterate_in_chunks(self):
+        with MAD() as mad:
+            mad.send("my_list = {1, 2, 3, 4, 5, 6, 7}")
+            for chunk_size in (1, 3, 7, 10):
+                self.assertEqual(
+                    list(mad.my_list.ipairs(chunk_size=chunk_size)), [1, 2, 3, 4, 5, 6, 7]
+                )
+            self.assertEqual(list(mad.my_list), [1, 2, 3, 4, 5, 6, 7])
+
+            mad.send("my_seq = sequence {MAD.element.marker 'mk' {}}")
+            names = [elem.name for elem in mad.my_seq.ipairs(chunk_size=1)]
+            self.assertEqual(names, ["$start", "mk", "$end"])
+
+    def test_pairs(self):
+        with MAD() as mad:
+            mad.send("my_tbl = {a = 1, b = 'two', c = {3}}")
+            for chunk_size in (1, 2, 5):
+                pairs = dict(mad.my_tbl.pairs(chunk_size=chunk_size))
+                self.assertEqual(sorted(pairs), ["a", "b", "c"])
+                self.assertEqual(pairs["a"], 1)
+                self.assertEqual(pairs["b"], "two")
+                self.assertEqual(pairs["c"]._name, "my_tbl['c']")
+                self.assertEqual(pairs["c"].eval(), [3])
+
+
+class TestScan(unittest.TestCase):
+    def test_scan(self):
+        with MAD() as mad:
+            mad.send("k1, k2 = 1, 2; function model (a, b) return {sum = a + b, prod = a * b} end")
+            a, b = np.linspace(0, 1, 11), np.arange(11.0)
+            res = mad.scan({"k1": a, "k2": b}, "model(k1, k2)", ["sum", "prod", "res.sum - k1"])
+            self.assertEqual(res.shape, (11, 3))
+            np.testing.assert_allclose(res, np.column_stack([a + b, a * b, b]))
+            self.assertEqual(mad["k1", "k2"], (1, 2))  # The knobs are restored
+
+            # Deferred expressions are restored as expressions, not as their values
+            mad.send("MADX.ka = 1; MADX.kb = function () return MADX.ka * 2 end")
+            res = mad.scan({"MADX.kb": [5, 6]}, "{kb = MADX.kb}", ["kb"])
+            self.assertEqual(res[:, 0].tolist(), [5, 6])
+            mad.MADX.ka = 3
+            self.assertEqual(mad.MADX.kb, 6)
+
+    def test_scan_errors(self):
+        with MAD(stdout="/dev/null", redirect_stderr=True) as mad:
+            mad.send("k = 0; function check (k) assert(k < 2, 'unstable'); return {k = k} end")
+            with self.assertRaises(RuntimeError):
+                mad.scan({"k": [1, 2]}, "check(k)", ["k"])
+            self.assertEqual(mad.k, 0)
+            res = mad.scan({"k": [1, 2]}, "check(k)", ["k"], skip_errors=True)
+            self.assertEqual(res[0, 0], 1)
+            self.assertTrue(np.isnan(res[1, 0]))
+            self.assertRaises(ValueError, lambda: mad.scan({"k": [1, 2], "j": [1]}, "k", ["k"]))
+
+
+class TestTrack(unittest.TestCase):
+    def test_track_stream(self):
+        with MAD() as mad:
+            mad.send("""
+            seq = MAD.sequence "seq" { l = 10, MAD.element.marker "mk" {at = 5} }
+            seq.beam = MAD.beam()
+            """)
+            x0 = [{"x": 1e-3, "px": 1e-5}, {"y": 2e-3}]
+            ring = mad.track_stream(mad.seq, 4, every=2, X0=x0, nturn=20)
+            turns, coords = ring.ordered()
+            self.assertEqual(turns.tolist(), [14, 16, 18, 20])
+            self.assertEqual(coords.shape, (4, 2, 6))
+            np.testing.assert_allclose(coords[:, 0, 0], 1e-3 + 1e-4 * turns, rtol=1e-6)
+            np.testing.assert_allclose(coords[:, 1, 2], 2e-3)
+
+            # Any array can hold the turns, e.g. a memory map
+            out = np.zeros((10, 2, 6))
+            ring = mad.track_stream("seq", out, X0=x0, nturn=10)
+            self.assertIs(ring.data, out)
+            np.testing.assert_allclose(out[-1, 0, 0], 2e-3, rtol=1e-6)
+
+    def test_track_bulk(self):
+        with MAD() as mad:
+            mad.send("""
+            seq = MAD.sequence "seq" { l = 10, MAD.element.marker "mk" {at = 5} }
+            seq.beam = MAD.beam()
+            """)
+            x0 = np.zeros((5, 6))
+            x0[:, 0], x0[:, 1] = np.linspace(0, 1e-3, 5), 1e-5
+            final, alive = mad.track_bulk(mad.seq, x0, chunk_size=2, nturn=3)
+            self.assertEqual(final.shape, (5, 6))
+            self.assertTrue(alive.all())
+            np.testing.assert_allclose(final[:, 0], x0[:, 0] + 3e-4, rtol=1e-6)
+            np.testing.assert_allclose(final[:, 1], 1e-5)
+            self.assertRaises(ValueError, lambda: mad.track_bulk(mad.seq, x0[:, :4]))
+
+            # An invalid argument leaves no particles in the pipe
+            self.assertRaises(RuntimeError, lambda: mad.track_bulk(mad.seq, x0, beam="nobeam.x"))
+            final, alive = mad.track_bulk(mad.seq, x0, nturn=1)
+            np.testing.assert_allclose(final[:, 0], x0[:, 0] + 1e-4, rtol=1e-6)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from pymadng import parallel_scan
+
+SETUP = "k1, k2 = 0, 0; function model (a, b) return {sum = a + b, prod = a * b} end"
+
+
+class TestParallelScan(unittest.TestCase):
+    def test_parallel_scan(self):
+        a, b = np.linspace(0, 1, 7), np.arange(5.0)
+        chunks = []
+        res = parallel_scan(
+            SETUP,
+            {"k1": a, "k2": b},
+            "model(k1, k2)",
+            ["sum", "prod"],
+            workers=3,
+            chunk_size=4,
+            callback=lambda indices, values: chunks.append((indices, values.copy())),
+        )
+        grid_a, grid_b = np.meshgrid(a, b, indexing="ij")
+        self.assertEqual(res.shape, (7, 5, 2))
+        np.testing.assert_allclose(res[..., 0], grid_a + grid_b)
+        np.testing.assert_allclose(res[..., 1], grid_a * grid_b)
+
+        # Each chunk is streamed with the grid indices of its points
+        self.assertEqual(sum(len(indices) for indices, _ in chunks), 35)
+        for indices, values in chunks:
+            np.testing.assert_allclose(values, res[indices[:, 0], indices[:, 1]])
+
+    def test_setup_function(self):
+        res = parallel_scan(
+            lambda mad: mad.send(SETUP), {"k1": [1, 2, 3]}, "model(k1, k1)", ["prod"], workers=2
+        )
+        np.testing.assert_allclose(res, [[1], [4], [9]])
+
+    def test_failure(self):
+        with self.assertRaises(RuntimeError):
+            parallel_scan(
+                "function check (k) assert(k < 2, 'unstable') return {k = k} end",
+                {"k": [1, 2, 3]},
+                "check(k)",
+                ["k"],
+                workers=2,
+                stdout="/dev/null",
+                redirect_stderr=True,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()